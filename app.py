@@ -1,28 +1,17 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
+import hashlib
 import json
+import os
 from datetime import datetime
-from utils import build_yearly_index, build_name_index, get_block_key, normalize
-from matcher import find_best_match
-from google_sheets import (
-    authenticate_google_sheets,
-    get_sheet_by_url,
-    read_sheet_to_df,
-    create_or_clear_sheet,
-    write_df_to_sheet,
-    delete_rows_by_indices
-)
 import config
 
-def clean_value(val):
-    """Clean single value: NA string → empty, NaN → empty"""
-    if pd.isna(val) or val == 'NA' or val == 'nan' or val == '':
-        return ''
-    return val
+# pandas, NumPy, rapidfuzz, gspread and oauth2client (via pipeline and
+# google_sheets) are imported where they are first needed, so the app
+# renders before they are loaded
 
 def clean_dataframe_for_display(df):
     """Clean DataFrame before display to avoid PyArrow errors"""
+    import numpy as np
     df = df.copy()
     df = df.replace(['NA', 'nan', np.nan, np.inf, -np.inf, None], '')
     for col in df.columns:
@@ -30,6 +19,28 @@ def clean_dataframe_for_display(df):
             df[col] = df[col].astype(str).replace('nan', '').replace('NA', '')
     return df
 
+@st.cache_resource(show_spinner=False)
+def get_client(credentials_path, credentials_hash):
+    """Authorized gspread client, reused across reruns until the credentials change"""
+    from google_sheets import authenticate_google_sheets
+    return authenticate_google_sheets(credentials_path)
+
+@st.cache_resource(show_spinner=False)
+def get_sheet_cache():
+    """Downloaded sheets shared across reruns, keyed by spreadsheet ID and modifiedTime"""
+    from google_sheets import SheetFrameCache
+    return SheetFrameCache()
+
+@st.cache_resource(show_spinner=False)
+def start_warm_up():
+    """Warm start (once per process): preload the last yearly index and the scorers in the background"""
+    from warmup import warm_start
+    return warm_start()
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
 def load_credentials():
     """Load credentials from Streamlit secrets or allow upload"""
     if "gcp_service_account" in st.secrets:
@@ -41,6 +52,9 @@ def load_credentials():
 
 st.title("Patient Duplicate Finder - Google Sheets Auto Update")
 
+if config.WARM_START or os.environ.get('WARM_START') == '1':
+    start_warm_up()
+
 # Try loading from secrets first
 if load_credentials():
     st.success("✅ Credentials loaded from secrets")
@@ -56,35 +70,63 @@ else:
         st.session_state['credentials_ready'] = True
 
 if st.session_state.get('credentials_ready', False):
-    yearly_url = st.text_input("Yearly Database Sheet URL")
+    yearly_urls = st.text_area("Yearly Database Sheet URLs (one per line, 'URL::Tab name' for another tab)")
     daily_url = st.text_input("Today's Daily Sheet URL (will be modified)")
+    yearly_sources = [line.strip() for line in yearly_urls.splitlines() if line.strip()]
     
     if st.button("Load Sheets"):
-        if yearly_url and daily_url:
+        if yearly_sources and daily_url:
             try:
-                client = authenticate_google_sheets("credentials.json")
-                yearly_spreadsheet = get_sheet_by_url(client, yearly_url)
-                daily_spreadsheet = get_sheet_by_url(client, daily_url)
+                from google_sheets import get_sheet_by_url, get_modified_time, fetch_sheet
+                from pipeline import split_source
+                from instrumentation import new_report, stage
+                from utils import run_concurrently
+                load_report = new_report()
+                with stage(load_report, 'authenticate'):
+                    client = get_client("credentials.json", file_hash("credentials.json"))
+                    daily_spreadsheet = get_sheet_by_url(client, daily_url)
                 
-                yearly_worksheet = yearly_spreadsheet.sheet1
                 daily_worksheet = daily_spreadsheet.sheet1
+                # Daily sheet plus every yearly source, or the LRU cycles and never hits;
+                # fetched here since the readers run on threads without a Streamlit context
+                sheet_cache = get_sheet_cache()
+                sheet_cache.reserve(len(yearly_sources) + 1)
                 
-                df_yearly = read_sheet_to_df(yearly_worksheet)
-                df_daily = read_sheet_to_df(daily_worksheet)
+                def read_daily():
+                    with stage(load_report, 'read daily'):
+                        return fetch_sheet(daily_spreadsheet, sheet_cache)[0]
+                
+                def read_yearly(source):
+                    with stage(load_report, f"read yearly {source}" if len(yearly_sources) > 1 else 'read yearly'):
+                        location, tab = split_source(source)
+                        spreadsheet = get_sheet_by_url(client, location)
+                        worksheet = spreadsheet.sheet1 if tab is None else spreadsheet.worksheet(tab)
+                        df, cached = sheet_cache.get(worksheet, get_modified_time(spreadsheet))
+                        source_id = spreadsheet.id if tab is None else f"{spreadsheet.id}:{worksheet.id}"
+                        return {'source': source, 'df': df, 'id': source_id, 'cached': cached}
+                
+                loaded = run_concurrently([read_daily] + [lambda source=source: read_yearly(source)
+                                                          for source in yearly_sources])
+                df_daily, yearly_loaded = loaded[0], loaded[1:]
+                cached = sum(source['cached'] for source in yearly_loaded)
+                if cached:
+                    st.caption(f"{cached} yearly sheet(s) unchanged since the last load, reused the cached copy")
                 
                 st.session_state['client'] = client
                 st.session_state['daily_spreadsheet'] = daily_spreadsheet
                 st.session_state['daily_worksheet'] = daily_worksheet
-                st.session_state['df_yearly'] = df_yearly
+                st.session_state['yearly_sources'] = yearly_loaded
                 st.session_state['df_daily'] = df_daily
                 st.session_state['files_ready'] = False
+                st.session_state['load_stages'] = load_report['stages']
                 
-                st.success(f"✅ {len(df_yearly)} yearly, {len(df_daily)} daily")
+                yearly_rows = sum(len(source['df']) for source in yearly_loaded)
+                st.success(f"✅ {yearly_rows} yearly ({len(yearly_loaded)} sources), {len(df_daily)} daily")
                 st.write("**Columns:**", list(df_daily.columns[:15]))
             except Exception as e:
                 st.error(f"❌ {e}")
     
-    if 'df_yearly' in st.session_state:
+    if 'yearly_sources' in st.session_state:
         cols = ['None'] + list(st.session_state['df_daily'].columns)
         
         st.subheader("Select Columns (minimum 1 required)")
@@ -102,164 +144,93 @@ if st.session_state.get('credentials_ready', False):
         if len(selected_cols) == 0:
             st.warning("⚠️ Select at least 1 column to compare")
         else:
+            top_k = st.number_input("Matches per daily row (across all yearly sources)", min_value=1, value=1)
+            consolidated = st.checkbox("Match against consolidated golden records (built by consolidate.py)")
+            within_day = st.checkbox("Also find duplicates within the daily sheet ('Within-Day Duplicates' tab)")
+            collect_report = st.checkbox("Collect performance report", value=True)
             if st.button("🔍 Find Duplicates & Update Sheets"):
-                df_yearly = st.session_state['df_yearly']
+                import pandas as pd
+                from pipeline import (
+                    find_duplicates_sharded,
+                    build_sharded_results,
+                    index_shard,
+                    find_within_day_duplicates,
+                    build_within_day_results,
+                    update_sheets,
+                    new_run_stats
+                )
+                from instrumentation import new_report, stage, record_block_stats, record_match_stats, write_report
                 df_daily = st.session_state['df_daily']
+                columns = (name_col, mobile_col, addr_col, extra_col)
                 
-                st.info("Building mobile index...")
-                yearly_blocks = build_yearly_index(df_yearly, mobile_col if mobile_col != 'None' else None)
+                report = None
+                if collect_report:
+                    report = new_report()
+                    report['stages'].extend(st.session_state.get('load_stages', []))
                 
-                st.info("Building name index...")
-                name_blocks = build_name_index(df_yearly, name_col if name_col != 'None' else None)
+                st.info("Loading yearly index...")
+                with stage(report, 'yearly index'):
+                    shards = [index_shard(source['source'], source['df'], source['id'], *columns,
+                                          consolidated=consolidated)
+                              for source in st.session_state['yearly_sources']]
+                st.info(f"Yearly index ready ({sum(shard['rows_added'] for shard in shards)} new rows indexed)")
+                if consolidated and any(shard['members'] is None for shard in shards):
+                    st.warning("⚠️ Some yearly sources have no up-to-date consolidation, all their rows are matched")
+                if len(shards) == 1:
+                    record_block_stats(report, shards[0]['index'])
                 
                 st.info("Comparing...")
-                perfect_duplicate_ids = set()
-                all_match_results = []
-                perfect_match_results = []
-                
-                for i, daily_row in df_daily.iterrows():
-                    # Try mobile blocking first if mobile column selected
-                    candidates = []
-                    if mobile_col != 'None':
-                        block_key = get_block_key(daily_row[mobile_col])
-                        candidates = yearly_blocks.get(block_key, [])
-                    
-                    # If no mobile match, try name blocking if name column selected
-                    if len(candidates) == 0 and name_col != 'None':
-                        name_key = normalize(daily_row[name_col])
-                        candidates = name_blocks.get(name_key, [])
-                    
-                    # If still no candidates and no blocking columns selected, use all yearly records
-                    if len(candidates) == 0 and mobile_col == 'None' and name_col == 'None':
-                        candidates = [row for _, row in df_yearly.iterrows()]
-                    
-                    best_match = find_best_match(daily_row, candidates, name_col, mobile_col, addr_col, extra_col)
-                    
-                    if best_match and best_match['match_type'] == '🟢 PERFECT':
-                        perfect_duplicate_ids.add(i)
-                    
-                    if best_match:
-                        if best_match['is_exact']:
-                            result = {
-                                'Daily_Rec': i+1,
-                                'Match_Type': best_match['match_type'],
-                                'Score': best_match['score']
-                            }
-                            
-                            # Add columns only if selected
-                            if name_col != 'None':
-                                result.update({
-                                    'Daily_Col1': clean_value(daily_row[name_col]),
-                                    'Yearly_Col1': clean_value(best_match['yearly_row'][name_col]),
-                                    'Col1': '✅'
-                                })
-                            if mobile_col != 'None':
-                                result.update({
-                                    'Daily_Col2': clean_value(daily_row[mobile_col]),
-                                    'Yearly_Col2': clean_value(best_match['yearly_row'][mobile_col]),
-                                    'Col2': '✅' if best_match.get('mobile_match', False) else '❌'
-                                })
-                            if addr_col != 'None':
-                                result.update({
-                                    'Daily_Col3': str(clean_value(daily_row[addr_col]))[:50],
-                                    'Yearly_Col3': str(clean_value(best_match['yearly_row'][addr_col]))[:50],
-                                    'Col3': '✅' if best_match.get('addr_match', False) else '❌'
-                                })
-                            if extra_col != 'None':
-                                result.update({
-                                    'Daily_Col4': str(clean_value(daily_row[extra_col]))[:50],
-                                    'Yearly_Col4': str(clean_value(best_match['yearly_row'][extra_col]))[:50],
-                                    'Col4': '✅' if best_match.get('extra_match', False) else '❌'
-                                })
-                            
-                            result.update({
-                                'Daily_Patient Address': clean_value(daily_row.get('Patient Address', '')),
-                                'Yearly_Patient Address': clean_value(best_match['yearly_row'].get('Patient Address', '')),
-                                'Daily_Facility Name Lform': clean_value(daily_row.get('Facility Name Lform', '')),
-                                'Yearly_Facility Name Lform': clean_value(best_match['yearly_row'].get('Facility Name Lform', '')),
-                                'Daily_Date Of Onset': clean_value(daily_row.get('Date Of Onset', '')),
-                                'Yearly_Date Of Onset': clean_value(best_match['yearly_row'].get('Date Of Onset', ''))
-                            })
-                        else:
-                            # Fuzzy match
-                            result = {
-                                'Daily_Rec': i+1,
-                                'Match_Type': best_match['match_type'],
-                                'Score': best_match['score']
-                            }
-                            
-                            if name_col != 'None':
-                                col1_emoji = '✅' if best_match.get('col1_pct', 0) >= 80 else '❌'
-                                result.update({
-                                    'Daily_Col1': clean_value(daily_row[name_col]),
-                                    'Yearly_Col1': clean_value(best_match['yearly_row'][name_col]),
-                                    'Col1': f"{col1_emoji} {int(best_match.get('col1_pct', 0))}%"
-                                })
-                            if mobile_col != 'None':
-                                result.update({
-                                    'Daily_Col2': clean_value(daily_row[mobile_col]),
-                                    'Yearly_Col2': clean_value(best_match['yearly_row'][mobile_col]),
-                                    'Col2': '✅' if best_match.get('col2_match', False) else '❌'
-                                })
-                            if addr_col != 'None':
-                                col3_emoji = '✅' if best_match.get('col3_pct', 0) >= 80 else '❌'
-                                result.update({
-                                    'Daily_Col3': str(clean_value(daily_row[addr_col]))[:50],
-                                    'Yearly_Col3': str(clean_value(best_match['yearly_row'][addr_col]))[:50],
-                                    'Col3': f"{col3_emoji} {int(best_match.get('col3_pct', 0))}%"
-                                })
-                            if extra_col != 'None':
-                                col4_emoji = '✅' if best_match.get('col4_pct', 0) >= 80 else '❌'
-                                result.update({
-                                    'Daily_Col4': str(clean_value(daily_row[extra_col]))[:50],
-                                    'Yearly_Col4': str(clean_value(best_match['yearly_row'][extra_col]))[:50],
-                                    'Col4': f"{col4_emoji} {int(best_match.get('col4_pct', 0))}%"
-                                })
-                            
-                            result.update({
-                                'Daily_Patient Address': clean_value(daily_row.get('Patient Address', '')),
-                                'Yearly_Patient Address': clean_value(best_match['yearly_row'].get('Patient Address', '')),
-                                'Daily_Facility Name Lform': clean_value(daily_row.get('Facility Name Lform', '')),
-                                'Yearly_Facility Name Lform': clean_value(best_match['yearly_row'].get('Facility Name Lform', '')),
-                                'Daily_Date Of Onset': clean_value(daily_row.get('Date Of Onset', '')),
-                                'Yearly_Date Of Onset': clean_value(best_match['yearly_row'].get('Date Of Onset', ''))
-                            })
-                        
-                        all_match_results.append(result)
-                        if best_match['match_type'] == '🟢 PERFECT':
-                            perfect_match_results.append(result)
+                stats = new_run_stats()
+                matches = find_duplicates_sharded(df_daily, shards, *columns, top_k=top_k,
+                                                  workers=0 if len(shards) > 1 else 1, stats=stats, report=report)
+                record_match_stats(report, matches, stats, len(df_daily))
+                st.caption(
+                    f"Scored {stats['candidates_scored']} candidates one by one "
+                    f"({stats['candidates_skipped']} skipped after a 100 match, {stats['candidates_pruned']} pruned, "
+                    f"{stats['columns_skipped']} column comparisons saved) and {stats['batch_pairs']} pairs in batches; "
+                    f"{stats['exact_settled']} perfect duplicates settled by the exact-match join"
+                )
+                with stage(report, 'build results'):
+                    df_all_duplicates, df_perfect_only, perfect_duplicate_ids = build_sharded_results(
+                        df_daily, shards, matches, *columns, top_k=top_k
+                    )
                 
-                df_all_duplicates = pd.DataFrame(all_match_results) if all_match_results else pd.DataFrame()
-                df_perfect_only = pd.DataFrame(perfect_match_results) if perfect_match_results else pd.DataFrame()
+                st.success(f"✅ Found {len(perfect_duplicate_ids)} PERFECT duplicates | {len(df_all_duplicates)} total matches")
                 
-                st.success(f"✅ Found {len(perfect_duplicate_ids)} PERFECT duplicates | {len(all_match_results)} total matches")
+                df_within_day = None
+                if within_day:
+                    st.info("Comparing daily rows with each other...")
+                    within_day_matches = find_within_day_duplicates(df_daily, *columns, report=report)
+                    with stage(report, 'build within-day results'):
+                        df_within_day = build_within_day_results(df_daily, within_day_matches, *columns)
+                    st.success(f"✅ Found {len(df_within_day)} duplicate pairs within the daily sheet")
                 
                 # Update Google Sheets
                 try:
-                    daily_spreadsheet = st.session_state['daily_spreadsheet']
-                    
-                    st.info("Step 1: Creating 'Possible Duplicates' tab...")
-                    if not df_all_duplicates.empty:
-                        possible_dup_sheet = create_or_clear_sheet(daily_spreadsheet, "Possible Duplicates")
-                        write_df_to_sheet(possible_dup_sheet, df_all_duplicates)
-                        st.success(f"✅ Created 'Possible Duplicates' with {len(df_all_duplicates)} rows")
-                    
-                    st.info("Step 2: Creating 'Perfect Duplicates' tab...")
-                    if not df_perfect_only.empty:
-                        perfect_dup_sheet = create_or_clear_sheet(daily_spreadsheet, "Perfect Duplicates")
-                        write_df_to_sheet(perfect_dup_sheet, df_perfect_only)
-                        st.success(f"✅ Created 'Perfect Duplicates' with {len(df_perfect_only)} rows")
-                    
-                    st.info("Step 3: Deleting perfect duplicates from Daily sheet...")
-                    if perfect_duplicate_ids:
-                        daily_worksheet = st.session_state['daily_worksheet']
-                        delete_rows_by_indices(daily_worksheet, list(perfect_duplicate_ids))
-                        st.success(f"✅ Deleted {len(perfect_duplicate_ids)} perfect duplicates from Daily sheet")
-                    
+                    update_sheets(
+                        st.session_state['daily_spreadsheet'],
+                        st.session_state['daily_worksheet'],
+                        df_all_duplicates,
+                        df_perfect_only,
+                        perfect_duplicate_ids,
+                        notify=lambda message, done: st.success(message) if done else st.info(message),
+                        report=report,
+                        df_within_day=df_within_day
+                    )
                     st.success("🎉 All updates completed successfully!")
                 except Exception as e:
                     st.error(f"❌ Error updating sheets: {e}")
                 
+                if report is not None:
+                    os.makedirs(config.RUN_REPORT_DIR, exist_ok=True)
+                    report_path = os.path.join(config.RUN_REPORT_DIR, f"run_{datetime.now():%Y%m%d_%H%M%S}.json")
+                    write_report(report, report_path)
+                    with st.expander("⏱️ Performance"):
+                        st.dataframe(pd.DataFrame(report['stages']), width='stretch')
+                        st.json(report['metrics'], expanded=False)
+                        st.download_button("Download run report (JSON)", json.dumps(report, indent=2, default=str),
+                                           file_name=os.path.basename(report_path), mime='application/json')
+                
                 # Display preview with cleaned data
                 if not df_all_duplicates.empty:
                     with st.expander("📋 Preview: Possible Duplicates"):
@@ -268,3 +239,7 @@ if st.session_state.get('credentials_ready', False):
                 if not df_perfect_only.empty:
                     with st.expander("🟢 Preview: Perfect Duplicates"):
                         st.dataframe(clean_dataframe_for_display(df_perfect_only.head(10)), width='stretch')
+                
+                if df_within_day is not None and not df_within_day.empty:
+                    with st.expander("👥 Preview: Within-Day Duplicates"):
+                        st.dataframe(clean_dataframe_for_display(df_within_day.head(10)), width='stretch')
@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import rapidfuzz
+from utils import build_yearly_index, build_name_index, build_column_cache, canonical_mobile
+from matcher import find_best_match, new_match_stats
+from index_store import _index_rows
+from pipeline import assign_blocks, find_duplicates, build_results, new_run_stats
+import config
+
+FIRST_NAMES = [
+    'Aarav', 'Abhishek', 'Aditi', 'Ajay', 'Akash', 'Amit', 'Anil', 'Anita', 'Anjali', 'Arjun',
+    'Arun', 'Asha', 'Deepak', 'Divya', 'Ganesh', 'Geeta', 'Gopal', 'Harish', 'Jyoti', 'Kavita',
+    'Kiran', 'Krishna', 'Lakshmi', 'Mahesh', 'Manoj', 'Meena', 'Mohan', 'Neha', 'Nisha', 'Pooja',
+    'Pradeep', 'Priya', 'Rahul', 'Rajesh', 'Ramesh', 'Rekha', 'Sanjay', 'Santosh', 'Savita', 'Shanti',
+    'Shivani', 'Sita', 'Sunil', 'Sunita', 'Suresh', 'Usha', 'Vijay', 'Vinod', 'Yogesh', 'Zainab',
+    'Mohammed', 'Fatima', 'Imran', 'Salma', 'Gurpreet', 'Harpreet', 'Venkatesh', 'Murugan', 'Lalitha', 'Bhavna'
+]
+LAST_NAMES = [
+    'Kumar', 'Sharma', 'Verma', 'Singh', 'Yadav', 'Patel', 'Gupta', 'Devi', 'Khan', 'Reddy',
+    'Nair', 'Pillai', 'Iyer', 'Rao', 'Das', 'Ghosh', 'Mishra', 'Pandey', 'Tiwari', 'Chauhan',
+    'Jadhav', 'Patil', 'Shinde', 'Kale', 'More', 'Pawar', 'Shaikh', 'Ansari', 'Bhosale', 'Gaikwad'
+]
+AREAS = [
+    'Gandhi Nagar', 'Shivaji Nagar', 'Nehru Colony', 'Station Road', 'Ambedkar Chowk', 'Main Bazar',
+    'Ram Nagar', 'Laxmi Nagar', 'Indira Colony', 'MG Road', 'Tilak Path', 'Subhash Marg'
+]
+CITIES = ['Pune', 'Nashik', 'Nagpur', 'Aurangabad', 'Solapur', 'Kolhapur', 'Satara', 'Sangli']
+FACILITIES = [f"PHC {city}" for city in CITIES] + [f"RH {city}" for city in CITIES]
+
+def _noisy_mobile(rng, number):
+    """Mobile number in one of the formats seen in the sheets"""
+    style = rng.random()
+    if style < 0.6:
+        return number
+    if style < 0.7:
+        return f"+91 {number}"
+    if style < 0.8:
+        return f"{number[:5]} {number[5:]}"
+    if style < 0.9:
+        return f"{number}.0"
+    return f"0{number}"
+
+def _typo(rng, text):
+    """One random edit: drop, swap, double or replace a character"""
+    if len(text) < 3:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    kind = rng.randrange(4)
+    if kind == 0:
+        return text[:i] + text[i + 1:]
+    if kind == 1:
+        return text[:i - 1] + text[i] + text[i - 1] + text[i + 1:]
+    if kind == 2:
+        return text[:i] + text[i] + text[i:]
+    return text[:i] + rng.choice('aeiou') + text[i + 1:]
+
+def _mobile_typo(rng, number):
+    """One digit of a 10-digit number replaced"""
+    i = rng.randrange(len(number))
+    return number[:i] + rng.choice('0123456789'.replace(number[i], '')) + number[i + 1:]
+
+def generate_patients(n, seed=0):
+    """Synthetic yearly sheet with n patients"""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        number = str(rng.choice('6789')) + ''.join(rng.choice('0123456789') for _ in range(9))
+        city = rng.choice(CITIES)
+        rows.append({
+            'Patient Name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'Mobile Number': _noisy_mobile(rng, number),
+            'Patient Address': f"{rng.randrange(1, 500)}, {rng.choice(AREAS)}, {city}",
+            'Age': str(rng.randrange(1, 90)),
+            'Facility Name Lform': rng.choice(FACILITIES),
+            'Date Of Onset': f"2026-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}"
+        })
+    return pd.DataFrame(rows)
+
+def generate_daily(df_yearly, n, duplicate_rate=0.3, typo_rate=0.2, mobile_noise_rate=0.3, namesake_rate=0.2,
+                   seed=1):
+    """Synthetic daily sheet: duplicate_rate of the rows are re-entries of yearly patients
+
+    Re-entries get a typo in the name and (independently) in the address at
+    typo_rate, and mobile_noise_rate of them their number in another format
+    or with one digit wrong. namesake_rate of the new patients share the
+    name of a yearly patient.
+    """
+    rng = random.Random(seed)
+    fresh = generate_patients(n, seed=seed + 1000).to_dict('records')
+    yearly_rows = df_yearly.to_dict('records')
+    rows = []
+    for i in range(n):
+        if yearly_rows and rng.random() < duplicate_rate:
+            row = dict(rng.choice(yearly_rows))
+            for field in ['Patient Name', 'Patient Address']:
+                if rng.random() < typo_rate:
+                    row[field] = _typo(rng, row[field])
+            if rng.random() < mobile_noise_rate:
+                number = canonical_mobile(row['Mobile Number'])
+                if rng.random() < 0.5:
+                    number = _mobile_typo(rng, number)
+                row['Mobile Number'] = _noisy_mobile(rng, number)
+            rows.append(row)
+        else:
+            row = fresh[i]
+            if yearly_rows and rng.random() < namesake_rate:
+                row['Patient Name'] = rng.choice(yearly_rows)['Patient Name']
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+def _measure(func, track_memory):
+    """Run func; returns (result, seconds, peak MB or None)
+
+    The timed run is never traced: tracemalloc slows allocation-heavy code
+    several times over. With track_memory, func runs a second time under
+    tracemalloc for the peak only.
+    """
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    if not track_memory:
+        return result, seconds, None
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 1024 / 1024
+
+def run_benchmarks(sizes, daily_rows, duplicate_rate, typo_rate, mobile_noise_rate=0.3, namesake_rate=0.2,
+                   track_memory=True, seed=0):
+    columns = ('Patient Name', 'Mobile Number', 'Patient Address', 'Age')
+    results = []
+
+    def record(name, yearly_rows, seconds, peak_mb, items, comparisons=None):
+        entry = {
+            'benchmark': name,
+            'yearly_rows': yearly_rows,
+            'daily_rows': daily_rows,
+            'seconds': round(seconds, 4),
+            'rows_per_second': round(items / seconds, 1) if seconds > 0 else None,
+            'peak_memory_mb': round(peak_mb, 1) if peak_mb is not None else None,
+            'comparisons_per_daily_row': round(comparisons, 2) if comparisons is not None else None
+        }
+        results.append(entry)
+        print(json.dumps(entry))
+
+    for size in sizes:
+        df_yearly = generate_patients(size, seed=seed)
+        df_daily = generate_daily(df_yearly, daily_rows, duplicate_rate, typo_rate, mobile_noise_rate, namesake_rate,
+                                  seed=seed + 1)
+
+        _, seconds, peak = _measure(lambda: build_yearly_index(df_yearly, columns[1]), track_memory)
+        record('build_yearly_index', size, seconds, peak, size)
+
+        _, seconds, peak = _measure(lambda: build_name_index(df_yearly, columns[0]), track_memory)
+        record('build_name_index', size, seconds, peak, size)
+
+        yearly_index = _index_rows(df_yearly, None, *columns)
+        daily_cache = build_column_cache(df_daily, *columns)
+        yearly_cache = build_column_cache(df_yearly, *columns, normalized=yearly_index['normalized'])
+        blocks = assign_blocks(df_daily, daily_cache, yearly_cache, yearly_index, *columns)
+
+        def match_all():
+            stats = new_match_stats()
+            for _, candidates, daily_positions in blocks:
+                for daily_pos in daily_positions:
+                    find_best_match(daily_cache, daily_pos, yearly_cache, candidates, *columns, stats=stats)
+            return stats
+
+        stats, seconds, peak = _measure(match_all, track_memory)
+        record('find_best_match', size, seconds, peak, daily_rows, stats['candidates_scored'] / daily_rows)
+
+        def end_to_end():
+            stats = new_run_stats()
+            matches = find_duplicates(df_daily, df_yearly, yearly_index, *columns, stats=stats)
+            build_results(df_daily, df_yearly, matches, *columns)
+            return stats
+
+        stats, seconds, peak = _measure(end_to_end, track_memory)
+        comparisons = (stats['candidates_scored'] + stats['batch_pairs']) / daily_rows
+        record('end_to_end', size, seconds, peak, daily_rows, comparisons)
+
+        # Unknown numbers through the whole multi-pass union: the fuzzy-heavy path
+        config.MULTIPASS_FOR_UNKNOWN_MOBILES, default = True, config.MULTIPASS_FOR_UNKNOWN_MOBILES
+        try:
+            stats, seconds, peak = _measure(end_to_end, track_memory)
+        finally:
+            config.MULTIPASS_FOR_UNKNOWN_MOBILES = default
+        comparisons = (stats['candidates_scored'] + stats['batch_pairs']) / daily_rows
+        record('end_to_end_multipass', size, seconds, peak, daily_rows, comparisons)
+
+    return results
+
+def compare_results(results, baseline, tolerance):
+    """Entries that got slower (or heavier) than baseline by more than tolerance"""
+    previous = {(r['benchmark'], r['yearly_rows'], r['daily_rows']): r for r in baseline['results']}
+    regressions = []
+    for entry in results:
+        old = previous.get((entry['benchmark'], entry['yearly_rows'], entry['daily_rows']))
+        if old is None:
+            continue
+        for metric in ['seconds', 'peak_memory_mb']:
+            if entry[metric] and old[metric] and entry[metric] > old[metric] * (1 + tolerance):
+                regressions.append(f"{entry['benchmark']} @ {entry['yearly_rows']} rows: "
+                                   f"{metric} {old[metric]} -> {entry[metric]}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks on synthetic patient data")
+    parser.add_argument('--sizes', default='10000,100000,1000000', help="Comma-separated yearly row counts")
+    parser.add_argument('--daily-rows', type=int, default=2000)
+    parser.add_argument('--duplicate-rate', type=float, default=0.3)
+    parser.add_argument('--typo-rate', type=float, default=0.2)
+    parser.add_argument('--mobile-noise-rate', type=float, default=0.3,
+                        help="Re-entries with the number reformatted or mistyped")
+    parser.add_argument('--namesake-rate', type=float, default=0.2,
+                        help="New patients sharing the name of a yearly patient")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass (faster, no peak memory)")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="Earlier results JSON to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown before flagging (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    results = run_benchmarks(sizes, args.daily_rows, args.duplicate_rate, args.typo_rate, args.mobile_noise_rate,
+                             args.namesake_rate, track_memory=not args.no_memory, seed=args.seed)
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'rapidfuzz': rapidfuzz.__version__,
+            'cpu_count': os.cpu_count(),
+            'duplicate_rate': args.duplicate_rate,
+            'typo_rate': args.typo_rate,
+            'mobile_noise_rate': args.mobile_noise_rate,
+            'namesake_rate': args.namesake_rate,
+            'seed': args.seed,
+            'batch_min_cells': config.BATCH_MIN_CELLS,
+            'batch_max_cells': config.BATCH_MAX_CELLS
+        },
+        'results': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION: {line}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
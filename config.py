@@ -11,3 +11,84 @@ THRESHOLD_LOW = 60
 
 # Default duplicate threshold
 DEFAULT_DUPLICATE_THRESHOLD = 80
+
+# Batch scoring: max daily x candidate cells scored in one similarity matrix;
+# smaller blocks than BATCH_MIN_CELLS are scored pair by pair with pruning
+BATCH_MAX_CELLS = 2_000_000
+BATCH_MIN_CELLS = 64
+
+# Persistent yearly index store (one sub-folder per sheet + column mapping)
+INDEX_CACHE_DIR = '.index_cache'
+
+# Google Sheets API: rows-deletion batch size and retry/backoff on quota errors
+DELETE_BATCH_SIZE = 500
+API_MAX_RETRIES = 5
+API_BACKOFF_SECONDS = 1.0
+
+# Chunked sheet reader: data rows per request, and text columns with at most
+# this share of distinct values are stored as categoricals
+READ_CHUNK_ROWS = 20_000
+CATEGORY_MAX_UNIQUE_RATIO = 0.1
+
+# JSON run reports written by the app's performance panel
+RUN_REPORT_DIR = 'run_reports'
+
+# Multi-pass blocking, used when a daily row has no (valid) mobile number.
+# Passes run in this order; the exact-name block is always kept in full and
+# the other passes add candidates up to MAX_CANDIDATES_PER_ROW.
+BLOCKING_PASSES = ['phonetic_name', 'sorted_name', 'address_lsh', 'extra_lsh']
+MAX_CANDIDATES_PER_ROW = 200
+SORTED_NEIGHBOURHOOD_WINDOW = 5
+LSH_QGRAM = 3
+LSH_NUM_PERM = 8
+LSH_BANDS = 4
+
+# Mobile blocking: exact canonical number first, then a fallback block on the
+# last MOBILE_SUFFIX_DIGITS digits (catches typos in the leading digits).
+# Fallback blocks larger than MOBILE_SUFFIX_MAX_BLOCK are ignored.
+MOBILE_SUFFIX_DIGITS = 7
+MOBILE_SUFFIX_MAX_BLOCK = 20
+# Rows with a valid number found in neither block are matched against their
+# exact name block only; set this to use the whole multi-pass union instead
+# (finds more typos, but also many more name-only matches).
+MULTIPASS_FOR_UNKNOWN_MOBILES = False
+
+# Google Sheets I/O: threads for concurrent reads/writes, and how many
+# downloaded sheets the app keeps in memory at least (reused while modifiedTime
+# is unchanged; grown to the number of sheets in one load)
+IO_MAX_WORKERS = 4
+SHEET_CACHE_MAX_ENTRIES = 4
+
+# Sheet writer: rows per update request, approximate JSON payload per request
+# (well under the Sheets API request size limit) and requests in flight per tab
+WRITE_CHUNK_ROWS = 10_000
+WRITE_CHUNK_BYTES = 2_000_000
+WRITE_MAX_INFLIGHT = 4
+
+# Watch mode: seconds between polls of the daily sheet
+WATCH_INTERVAL_SECONDS = 60
+
+# Self-joins (yearly consolidation, within-day duplicates): blocks to pair
+# rows from, all pairs for blocks up to SELF_JOIN_MAX_BLOCK rows and only the
+# next SELF_JOIN_WINDOW rows in bigger ones. Pairs are linked on an exact
+# match of SELF_JOIN_EXACT_TYPES or a fuzzy score of SELF_JOIN_MIN_SCORE.
+SELF_JOIN_BLOCKS = ['mobile', 'mobile_suffix', 'name', 'phonetic_name']
+SELF_JOIN_MAX_BLOCK = 50
+SELF_JOIN_WINDOW = 10
+SELF_JOIN_EXACT_TYPES = ['🟢 PERFECT', '🟢 STRONG']
+SELF_JOIN_MIN_SCORE = 90
+
+# Within-day duplicates (self-join of the daily sheet): exact name matches with
+# at least this many equal columns (name included) or fuzzy scores from
+# WITHIN_DAY_MIN_SCORE are reported, and either way a column besides the name
+# must agree (equal mobile, or address/extra from WITHIN_DAY_MIN_FIELD_PCT %).
+# Name-only matches are left out, common names share a day too often.
+WITHIN_DAY_MIN_EXACT_COLUMNS = 2
+WITHIN_DAY_MIN_SCORE = DEFAULT_DUPLICATE_THRESHOLD
+WITHIN_DAY_MIN_FIELD_PCT = 80
+
+# Warm start (app): on boot, preload the most recently used yearly index and
+# run the scorers on this many of its values in the background. Also enabled
+# by the WARM_START=1 environment variable.
+WARM_START = False
+WARM_START_SAMPLE_ROWS = 200
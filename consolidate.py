@@ -0,0 +1,194 @@
+"""Offline consolidation of the yearly sheet into one golden record per patient
+
+The yearly sheet holds many repeat entries of the same patient, and every
+one of them sits in the blocks and is scored again for each daily row.
+consolidate_yearly() self-joins the yearly sheet with the regular blocking
+keys (utils.self_join_pairs) and links pairs with the usual
+check_exact_match/check_fuzzy_match scoring (matcher.score_pairs). Linked
+rows are clustered with union-find, and each cluster is represented by its
+most complete row. The compacted index (representatives only) and the
+cluster membership are stored next to the regular yearly index.
+
+Daily runs with --consolidated block and fuzzy-score against the
+representatives only (the exact join for perfect duplicates still sees every
+yearly row) and list every yearly row of the matched cluster in a
+Yearly_Linked_Recs column. Rows appended to the yearly sheet after
+consolidation are matched as clusters of their own until the job is run
+again.
+"""
+import argparse
+import sys
+import numpy as np
+from utils import build_column_cache, self_join_pairs, self_join_indexes
+from matcher import score_pairs
+from index_store import (
+    load_or_build_yearly_index,
+    consolidation_path,
+    save_consolidation,
+    load_consolidation,
+    _index_rows
+)
+from instrumentation import new_report, stage, record, size_summary, write_report
+
+def union_find_labels(n_rows, pairs):
+    """Cluster label of every row (the smallest position in its cluster) from linked (i, j) pairs"""
+    parent = list(range(n_rows))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]  # path halving
+            x = parent[x]
+        return x
+
+    for i, j in pairs.tolist():
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            # The smaller root wins, so labels come out as the first row of each cluster
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    return np.asarray([find(x) for x in range(n_rows)], dtype=np.int64)
+
+def cluster_members(labels, completeness):
+    """Representatives and CSR membership of the clusters in labels
+
+    The representative of a cluster is its row with the most filled columns
+    (the earliest one on ties). Clusters are ordered by representative
+    position; cluster k holds member_positions[member_offsets[k]:member_offsets[k + 1]].
+    """
+    positions = np.arange(len(labels))
+    best = np.lexsort((positions, -completeness, labels))
+    first = np.r_[True, labels[best][1:] != labels[best][:-1]] if len(labels) else np.zeros(0, dtype=bool)
+    rep_of_label = np.zeros(len(labels), dtype=np.int64)
+    rep_of_label[labels[best][first]] = best[first]
+
+    reps_by_row = rep_of_label[labels]
+    order = np.lexsort((positions, reps_by_row))
+    sizes = np.bincount(reps_by_row, minlength=len(labels))
+    representatives = np.flatnonzero(sizes)
+    return {
+        'representatives': representatives,
+        'member_offsets': np.r_[0, np.cumsum(sizes[representatives])].astype(np.int64),
+        'member_positions': order.astype(np.int64)
+    }
+
+def consolidate_yearly(df_yearly, yearly_index, name_col, mobile_col, addr_col, extra_col, min_score=None,
+                       stats=None, report=None):
+    """Cluster the repeat entries of df_yearly; returns a consolidation dict for save_consolidation
+
+    yearly_index is the regular index of df_yearly (load_or_build_yearly_index).
+    """
+    columns = (name_col, mobile_col, addr_col, extra_col)
+    cache = build_column_cache(df_yearly, *columns, normalized=yearly_index['normalized'])
+    with stage(report, 'candidate pairs'):
+        pairs = self_join_pairs(self_join_indexes(yearly_index, cache, name_col), len(df_yearly))
+    with stage(report, 'score pairs'):
+        links = score_pairs(cache, pairs, *columns, min_score=min_score, stats=stats)
+    with stage(report, 'cluster'):
+        labels = union_find_labels(len(df_yearly), np.column_stack((links['daily_pos'], links['yearly_pos'])))
+        completeness = (yearly_index['normalized'] != '').sum(axis=1).to_numpy()
+        consolidation = cluster_members(labels, completeness)
+    with stage(report, 'compacted index'):
+        consolidation['index'] = _index_rows(df_yearly.iloc[consolidation['representatives']], None, *columns)
+    consolidation['yearly_hashes'] = yearly_index['row_hashes']
+    consolidation['pairs'] = len(pairs)
+    consolidation['links'] = len(links['daily_pos'])
+
+    sizes = np.diff(consolidation['member_offsets'])
+    record(report, 'consolidation', {
+        'yearly_rows': len(df_yearly),
+        'candidate_pairs': len(pairs),
+        'links': consolidation['links'],
+        'clusters': len(sizes),
+        'cluster_sizes': size_summary(sizes)
+    })
+    return consolidation
+
+def load_compact_yearly(df_yearly, yearly_index, source_id, name_col, mobile_col, addr_col, extra_col,
+                        cache_dir=None):
+    """The consolidated view of df_yearly: {'df', 'index', 'representatives', 'members'}, or None
+
+    'df' and 'index' hold the cluster representatives (compact position k is
+    yearly row representatives[k]); 'members' is the cluster membership, with
+    'cluster_of' giving the cluster of every yearly row. None means there is
+    no usable consolidation (never run, or the consolidated rows were since
+    edited or removed, going by the row hashes of yearly_index, the current
+    index of df_yearly). Rows appended after consolidation are indexed in
+    memory as clusters of one.
+    """
+    columns = (name_col, mobile_col, addr_col, extra_col)
+    consolidation = load_consolidation(consolidation_path(source_id, *columns, cache_dir=cache_dir))
+    if consolidation is None:
+        return None
+    rows = len(consolidation['yearly_hashes'])
+    if rows > len(df_yearly) or not np.array_equal(consolidation['yearly_hashes'], yearly_index['row_hashes'][:rows]):
+        return None
+
+    index = consolidation['index']
+    representatives = consolidation['representatives']
+    member_offsets = consolidation['member_offsets']
+    member_positions = consolidation['member_positions']
+    new_rows = np.arange(rows, len(df_yearly))
+    if len(new_rows):
+        index = _index_rows(df_yearly.iloc[new_rows], index, *columns)
+        representatives = np.r_[representatives, new_rows]
+        member_offsets = np.r_[member_offsets, member_offsets[-1] + np.arange(1, len(new_rows) + 1)]
+        member_positions = np.r_[member_positions, new_rows]
+    cluster_of = np.empty(len(df_yearly), dtype=np.int64)
+    cluster_of[member_positions] = np.repeat(np.arange(len(representatives)), np.diff(member_offsets))
+    return {
+        'df': df_yearly.iloc[representatives].reset_index(drop=True),
+        'index': index,
+        'representatives': representatives,
+        'members': {'offsets': member_offsets, 'positions': member_positions, 'cluster_of': cluster_of}
+    }
+
+def linked_records(members, yearly_positions):
+    """Yearly record numbers (1-based, comma separated) of the clusters of the rows at yearly_positions"""
+    offsets, positions = members['offsets'], members['positions']
+    return [", ".join(str(pos + 1) for pos in positions[offsets[k]:offsets[k + 1]].tolist())
+            for k in members['cluster_of'][np.asarray(yearly_positions, dtype=np.int64)].tolist()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cluster repeat entries of a yearly sheet into golden records")
+    parser.add_argument('--yearly', required=True,
+                        help="Yearly sheet URL (optionally 'URL::Tab name') or local .csv/.parquet file")
+    parser.add_argument('--name-col', default='None', help="Column 1 (Name)")
+    parser.add_argument('--mobile-col', default='None', help="Column 2 (Mobile)")
+    parser.add_argument('--addr-col', default='None', help="Column 3 (Address)")
+    parser.add_argument('--extra-col', default='None', help="Column 4 (Extra)")
+    parser.add_argument('--min-score', type=int, help="Fuzzy score that links two rows (default from config)")
+    parser.add_argument('--credentials', help="Service account JSON (needed for sheet URLs)")
+    parser.add_argument('--report', help="Write a JSON report (stage timings, cluster sizes) to this file")
+    args = parser.parse_args(argv)
+
+    columns = (args.name_col, args.mobile_col, args.addr_col, args.extra_col)
+    if all(col == 'None' for col in columns):
+        parser.error("select at least 1 column to compare")
+
+    from pipeline import load_frame, new_run_stats
+    client = None
+    if args.credentials:
+        from google_sheets import authenticate_google_sheets
+        client = authenticate_google_sheets(args.credentials)
+
+    report = new_report() if args.report else None
+    with stage(report, 'read yearly'):
+        df_yearly, yearly_id = load_frame(args.yearly, client)
+    with stage(report, 'yearly index'):
+        yearly_index, _ = load_or_build_yearly_index(df_yearly, yearly_id, *columns)
+    stats = new_run_stats()
+    consolidation = consolidate_yearly(df_yearly, yearly_index, *columns, min_score=args.min_score, stats=stats,
+                                       report=report)
+    with stage(report, 'save'):
+        save_consolidation(consolidation, consolidation_path(yearly_id, *columns))
+
+    sizes = np.diff(consolidation['member_offsets'])
+    print(f"Consolidated {len(df_yearly)} yearly rows into {len(sizes)} clusters "
+          f"({consolidation['links']} links from {consolidation['pairs']} candidate pairs, "
+          f"largest cluster {sizes.max() if len(sizes) else 0} rows)")
+    if args.report:
+        write_report(report, args.report)
+        print(f"Report written to {args.report}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""In-memory stand-ins for gspread Spreadsheet/Worksheet, for offline runs and tests
+
+Only the calls this app makes are implemented. Every API call is counted in
+spreadsheet.calls, every edit moves get_lastUpdateTime() on, and fail_next()
+makes the next calls raise an APIError (429 by default) to exercise retry
+handling.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol
+
+def _trim(row):
+    while row and row[-1] == '':
+        row.pop()
+    return row
+
+class FakeResponse:
+    """Minimal requests.Response used to build gspread APIErrors"""
+
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.text = message
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': self.text, 'status': 'FAKE'}}
+
+class FakeSpreadsheet:
+    def __init__(self, spreadsheet_id='fake-spreadsheet', title='Fake'):
+        self.id = spreadsheet_id
+        self.title = title
+        self.calls = Counter()
+        self._worksheets = []
+        self._failures = []
+        self._edits = 0
+
+    def fail_next(self, count=1, status_code=429):
+        """Make the next `count` API calls fail with status_code"""
+        self._failures.extend([status_code] * count)
+
+    def _api_call(self, name):
+        self.calls[name] += 1
+        if self._failures:
+            status_code = self._failures.pop(0)
+            raise APIError(FakeResponse(status_code, f"fake error on {name}"))
+
+    def _touch(self):
+        self._edits += 1
+
+    def get_lastUpdateTime(self):
+        """Drive-style modifiedTime, one second later per edit"""
+        self._api_call('get_lastUpdateTime')
+        modified = datetime(2026, 1, 1) + timedelta(seconds=self._edits)
+        return modified.isoformat(timespec='milliseconds') + 'Z'
+
+    @property
+    def sheet1(self):
+        return self._worksheets[0]
+
+    def worksheets(self):
+        return list(self._worksheets)
+
+    def worksheet(self, title):
+        self._api_call('worksheet')
+        for ws in self._worksheets:
+            if ws.title == title:
+                return ws
+        raise WorksheetNotFound(title)
+
+    def add_worksheet(self, title, rows, cols):
+        self._api_call('add_worksheet')
+        ws = FakeWorksheet(self, title, sheet_id=len(self._worksheets), rows=rows, cols=cols)
+        self._worksheets.append(ws)
+        self._touch()
+        return ws
+
+    def batch_update(self, body):
+        self._api_call('batch_update')
+        for request in body['requests']:
+            if 'deleteDimension' not in request:
+                raise NotImplementedError(f"fake batch_update request: {list(request)}")
+            rng = request['deleteDimension']['range']
+            if rng['dimension'] != 'ROWS':
+                raise NotImplementedError("fake deleteDimension only supports ROWS")
+            ws = next(ws for ws in self._worksheets if ws.id == rng['sheetId'])
+            del ws.values[rng['startIndex']:rng['endIndex']]
+            ws.row_count -= rng['endIndex'] - rng['startIndex']
+        self._touch()
+        return {'replies': [{} for _ in body['requests']]}
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, values=None, sheet_id=0, rows=1000, cols=26):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.values = [list(row) for row in (values or [])]
+        self.row_count = max(rows, len(self.values))
+        self.col_count = max([cols] + [len(row) for row in self.values])
+
+    @classmethod
+    def from_records(cls, spreadsheet, title, header, rows):
+        """Add a worksheet holding a header row plus data rows to spreadsheet"""
+        ws = cls(spreadsheet, title, [header] + [list(r) for r in rows], sheet_id=len(spreadsheet._worksheets))
+        spreadsheet._worksheets.append(ws)
+        return ws
+
+    def get_all_values(self):
+        self.spreadsheet._api_call('get_all_values')
+        return [list(row) for row in self.values]
+
+    def row_values(self, row):
+        self.spreadsheet._api_call('row_values')
+        values = self.values[row - 1] if row <= len(self.values) else []
+        return _trim(list(values))
+
+    def get(self, range_name):
+        """Values of an A1 range like 'A2:D100' (trailing blanks trimmed like the API)"""
+        self.spreadsheet._api_call('get')
+        start, end = range_name.split(':')
+        (first_row, first_col), (last_row, last_col) = a1_to_rowcol(start), a1_to_rowcol(end)
+        rows = [_trim(list(row[first_col - 1:last_col])) for row in self.values[first_row - 1:last_row]]
+        while rows and not rows[-1]:
+            rows.pop()
+        return rows
+
+    def get_all_records(self):
+        self.spreadsheet._api_call('get_all_records')
+        if not self.values:
+            return []
+        header = self.values[0]
+        rows = self.values[1:]
+        while rows and not any(v != '' for v in rows[-1]):
+            rows = rows[:-1]
+        return [dict(zip(header, row + [''] * (len(header) - len(row)))) for row in rows]
+
+    def update(self, values, range_name='A1'):
+        self.spreadsheet._api_call('update')
+        row_offset = int(''.join(ch for ch in range_name.split(':')[0] if ch.isdigit()) or 1) - 1
+        needed = row_offset + len(values)
+        while len(self.values) < needed:
+            self.values.append([])
+        for i, row in enumerate(values):
+            self.values[row_offset + i] = list(row)
+        self.row_count = max(self.row_count, needed)
+        self.spreadsheet._touch()
+
+    def append_rows(self, values, value_input_option=None, table_range=None):
+        """Add rows after the last non-blank row, like values.append"""
+        self.spreadsheet._api_call('append_rows')
+        filled = len(self.values)
+        while filled and not any(v != '' for v in self.values[filled - 1]):
+            filled -= 1
+        del self.values[filled:]
+        self.values.extend(list(row) for row in values)
+        self.row_count = max(self.row_count, len(self.values))
+        self.spreadsheet._touch()
+
+    def resize(self, rows=None, cols=None):
+        self.spreadsheet._api_call('resize')
+        if rows is not None:
+            del self.values[rows:]
+            self.row_count = rows
+        if cols is not None:
+            self.values = [row[:cols] for row in self.values]
+            self.col_count = cols
+        self.spreadsheet._touch()
+
+    def clear(self):
+        self.spreadsheet._api_call('clear')
+        self.values = []
+        self.spreadsheet._touch()
+
+    def delete_rows(self, start_index, end_index=None):
+        self.spreadsheet._api_call('delete_rows')
+        end_index = end_index or start_index
+        del self.values[start_index - 1:end_index]
+        self.row_count -= end_index - start_index + 1
+        self.spreadsheet._touch()
@@ -1,7 +1,16 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import gspread
+from gspread.exceptions import APIError, WorksheetNotFound
 from oauth2client.service_account import ServiceAccountCredentials
 import pandas as pd
 import numpy as np
+import config
+
+RETRY_STATUS_CODES = {429}
+# Value writes are idempotent, so they are also retried on server errors
+WRITE_RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
 
 def authenticate_google_sheets(json_keyfile_path):
     """Authenticate with Google Sheets API"""
@@ -16,40 +25,293 @@ def get_sheet_by_url(client, url):
     """Open sheet by URL"""
     return client.open_by_url(url)
 
-def read_sheet_to_df(worksheet):
-    """Read worksheet to pandas DataFrame"""
-    data = worksheet.get_all_records()
-    return pd.DataFrame(data)
+def get_modified_time(spreadsheet):
+    """Drive modifiedTime of a spreadsheet (changes on every edit)"""
+    # gspread 6 caches lastUpdateTime when the sheet is opened; get_lastUpdateTime refetches it
+    getter = getattr(spreadsheet, 'get_lastUpdateTime', None)
+    if getter is not None:
+        return call_with_retry(getter)
+    return call_with_retry(lambda: spreadsheet.lastUpdateTime)
+
+class SheetFrameCache:
+    """Downloaded worksheets keyed by spreadsheet ID, worksheet ID and Drive modifiedTime
+
+    An unchanged sheet is served from memory; an edited one has a new
+    modifiedTime, so it is downloaded again and replaces the older copy.
+    Safe to share between threads and Streamlit sessions. Frames are shared,
+    not copied, so callers must not modify them in place.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or config.SHEET_CACHE_MAX_ENTRIES
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, entries):
+        """Grow the cache to hold at least entries sheets (e.g. all sources of one load)"""
+        with self._lock:
+            self.max_entries = max(self.max_entries, entries)
+    
+    def get(self, worksheet, modified_time, loader=None):
+        """(DataFrame, from_cache) for worksheet as of modified_time"""
+        sheet_key = (worksheet.spreadsheet.id, worksheet.id)
+        with self._lock:
+            cached = self._frames.get(sheet_key)
+            if cached is not None and cached[0] == modified_time:
+                # Re-insert so the least recently used sheet is evicted first
+                self._frames[sheet_key] = self._frames.pop(sheet_key)
+                return cached[1], True
+        
+        df = (loader or read_sheet_to_df)(worksheet)
+        with self._lock:
+            self._frames.pop(sheet_key, None)
+            self._frames[sheet_key] = (modified_time, df)
+            while len(self._frames) > self.max_entries:
+                self._frames.pop(next(iter(self._frames)))
+        return df, False
+
+def fetch_sheet(spreadsheet, cache=None):
+    """(DataFrame, from_cache) for the first tab, skipping the download when cache has it"""
+    worksheet = spreadsheet.sheet1
+    if cache is None:
+        return read_sheet_to_df(worksheet), False
+    return cache.get(worksheet, get_modified_time(spreadsheet))
+
+def read_sheet_to_df(worksheet, chunk_rows=None):
+    """Read worksheet to pandas DataFrame
 
-def create_or_clear_sheet(spreadsheet, sheet_name):
-    """Create new sheet or clear existing one"""
+    Values are kept as text (so mobile numbers are never turned into floats)
+    and low-cardinality columns are stored as categoricals.
+    """
+    # Chunks are split into columns as they arrive. Repeated values of
+    # low-cardinality columns are shared right away (a column stops being
+    # deduplicated once it has too many distinct values), so the raw text of
+    # the whole sheet is never held at once.
+    limit = worksheet.row_count * config.CATEGORY_MAX_UNIQUE_RATIO
+    pieces = {}
+    distinct = {}
+    for chunk in iter_sheet_chunks(worksheet, chunk_rows):
+        for col in chunk.columns:
+            # A copy, not a view that would keep the whole chunk alive
+            values = chunk[col].to_numpy(dtype=object, copy=True)
+            seen = distinct.setdefault(col, {})
+            if seen is not None:
+                values[:] = [seen.setdefault(value, value) for value in values]
+                if len(seen) > limit:
+                    distinct[col] = None
+            pieces.setdefault(col, []).append(values)
+    if not pieces:
+        return pd.DataFrame()
+    return pd.DataFrame({col: compact_column(pieces.pop(col), distinct[col]) for col in list(pieces)}, copy=False)
+
+def iter_sheet_chunks(worksheet, chunk_rows=None):
+    """Yield the worksheet as DataFrames of up to chunk_rows data rows
+
+    Each chunk is one A1 range request, converted straight into text columns,
+    so the raw values of the whole sheet are never held at once.
+    """
+    chunk_rows = chunk_rows or config.READ_CHUNK_ROWS
+    header = call_with_retry(lambda: worksheet.row_values(1))
+    if not header:
+        return
+    last_col = gspread.utils.rowcol_to_a1(1, len(header))[:-1]
+    
+    # Blank rows are only kept if data follows them, like get_all_records
+    pending_blank = 0
+    for start in range(2, worksheet.row_count + 1, chunk_rows):
+        end = min(start + chunk_rows - 1, worksheet.row_count)
+        rows = call_with_retry(lambda: worksheet.get(f"A{start}:{last_col}{end}"))
+        rows = [list(row) for row in rows]
+        
+        last_filled = max((i for i, row in enumerate(rows) if any(v != '' for v in row)), default=-1)
+        if last_filled < 0:
+            pending_blank += end - start + 1
+            continue
+        
+        rows = [[] for _ in range(pending_blank)] + rows[:last_filled + 1]
+        pending_blank = (end - start + 1) - (last_filled + 1)
+        yield _rows_to_frame(rows, header)
+
+def _rows_to_frame(rows, header):
+    width = len(header)
+    padded = [row[:width] + [''] * (width - len(row)) for row in rows]
+    columns = zip(*padded) if padded else [()] * width
+    return pd.DataFrame({
+        col: pd.Series(values, dtype=object)
+        for col, values in zip(header, columns)
+    })
+
+def compact_column(pieces, distinct):
+    """One text column from its chunks, as a categorical when it has few distinct values (None: too many)"""
+    values = pd.Series(np.concatenate(pieces), dtype=object)
+    if len(values) and distinct is not None and len(distinct) <= len(values) * config.CATEGORY_MAX_UNIQUE_RATIO:
+        return values.astype('category')
+    return values
+
+def create_or_clear_sheet(spreadsheet, sheet_name, rows=1000, cols=30):
+    """Create new sheet or clear existing one, sized to rows x cols"""
     try:
-        worksheet = spreadsheet.worksheet(sheet_name)
-        worksheet.clear()
-        return worksheet
-    except:
-        worksheet = spreadsheet.add_worksheet(title=sheet_name, rows=1000, cols=30)
-        return worksheet
+        worksheet = call_with_retry(lambda: spreadsheet.worksheet(sheet_name))
+    except WorksheetNotFound:
+        return call_with_retry(lambda: spreadsheet.add_worksheet(title=sheet_name, rows=rows, cols=cols))
+    call_with_retry(worksheet.clear)
+    if (worksheet.row_count, worksheet.col_count) != (rows, cols):
+        call_with_retry(lambda: worksheet.resize(rows=rows, cols=cols))
+    return worksheet
 
-def write_df_to_sheet(worksheet, df):
-    """Write DataFrame to worksheet - handles NaN values"""
-    # Replace NaN, None, inf with empty string
-    df_clean = df.replace([np.nan, np.inf, -np.inf, None], '', regex=False)
+def sheet_values(df):
+    """Cell text of df as an object array: NaN, None, inf and 'nan' become '', the rest str()
+
+    One pass per column, without copying the whole frame.
+    """
+    values = np.empty((len(df), len(df.columns)), dtype=object)
+    for j in range(len(df.columns)):
+        column = df.iloc[:, j]
+        raw = column.to_numpy(dtype=object)
+        text = column.astype(str).to_numpy(dtype=object, copy=True)
+        blank = pd.isna(raw) | (raw == np.inf) | (raw == -np.inf) | (text == 'nan')
+        text[blank] = ''
+        values[:, j] = text
+    return values
+
+def write_chunks(values, max_rows=None, max_bytes=None):
+    """(start, end) row ranges of values, each at most max_rows rows and ~max_bytes of JSON"""
+    max_rows = max_rows or config.WRITE_CHUNK_ROWS
+    max_bytes = max_bytes or config.WRITE_CHUNK_BYTES
+    # Cell text plus quotes and a comma; non-ASCII text is undercounted, hence the margin in max_bytes
+    row_bytes = np.zeros(len(values), dtype=np.int64)
+    for j in range(values.shape[1]):
+        row_bytes += pd.Series(values[:, j], dtype=object).str.len().to_numpy(dtype=np.int64) + 3
+    ends = np.cumsum(row_bytes)
     
-    # Convert all values to strings to avoid JSON issues
-    df_clean = df_clean.astype(str)
+    chunks = []
+    start = 0
+    while start < len(values):
+        sent = ends[start - 1] if start else 0
+        end = int(np.searchsorted(ends, sent + max_bytes, side='right'))
+        end = min(max(end, start + 1), start + max_rows, len(values))
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+def write_df_to_sheet(worksheet, df, max_rows=None, max_bytes=None, max_inflight=None):
+    """Write DataFrame to worksheet - handles NaN values
+
+    The header and rows are sent as payload-bounded chunks (see write_chunks),
+    up to max_inflight requests at a time, each retried on 429 and 5xx
+    errors. The worksheet is grown first if the frame does not fit.
+    """
+    max_inflight = max_inflight or config.WRITE_MAX_INFLIGHT
+    values = sheet_values(df)
+    rows, cols = len(df) + 1, max(len(df.columns), 1)
+    if worksheet.row_count < rows or worksheet.col_count < cols:
+        call_with_retry(lambda: worksheet.resize(rows=max(rows, worksheet.row_count),
+                                                 cols=max(cols, worksheet.col_count)))
     
-    # Replace 'nan' strings with empty strings
-    df_clean = df_clean.replace('nan', '', regex=False)
+    def send(start, end):
+        # Data row i goes to sheet row i + 2 (row 1 is the header)
+        payload = values[start:end].tolist()
+        if start == 0:
+            payload.insert(0, [str(col) for col in df.columns])
+            range_name = 'A1'
+        else:
+            range_name = f"A{start + 2}"
+        call_with_retry(lambda: worksheet.update(values=payload, range_name=range_name),
+                        statuses=WRITE_RETRY_STATUS_CODES)
     
-    # Write to sheet
-    worksheet.update([df_clean.columns.values.tolist()] + df_clean.values.tolist())
+    chunks = write_chunks(values, max_rows, max_bytes) or [(0, 0)]
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        pending = set()
+        for start, end in chunks:
+            # Keep at most max_inflight chunks queued; stop early if one of them failed
+            if len(pending) >= max_inflight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(pool.submit(send, start, end))
+        for future in pending:
+            future.result()
 
-def delete_rows_by_indices(worksheet, row_indices):
-    """Delete specific rows from worksheet"""
-    # Sort in reverse to delete from bottom to top
-    sorted_indices = sorted(row_indices, reverse=True)
+def append_df_to_sheet(spreadsheet, sheet_name, df, max_rows=None, max_bytes=None):
+    """Append df below the rows already in a tab, creating the tab (with a header) if needed
+
+    Columns are matched to the existing header by name. Chunks (see
+    write_chunks) are appended one after the other, and only retried on 429
+    since an append is not idempotent.
+    """
+    try:
+        worksheet = call_with_retry(lambda: spreadsheet.worksheet(sheet_name))
+        header = call_with_retry(lambda: worksheet.row_values(1))
+    except WorksheetNotFound:
+        worksheet, header = None, []
+    if not header:
+        if worksheet is None:
+            worksheet = create_or_clear_sheet(spreadsheet, sheet_name, rows=len(df) + 1, cols=len(df.columns))
+        write_df_to_sheet(worksheet, df, max_rows, max_bytes)
+        return worksheet
+    
+    values = sheet_values(df.reindex(columns=header))
+    for start, end in write_chunks(values, max_rows, max_bytes):
+        payload = values[start:end].tolist()
+        call_with_retry(lambda: worksheet.append_rows(payload, value_input_option='RAW', table_range='A1'))
+    return worksheet
+
+def call_with_retry(request, retries=None, backoff=None, statuses=None):
+    """Run an API call, retrying with exponential backoff on quota errors
+
+    statuses overrides the HTTP statuses that are retried (RETRY_STATUS_CODES).
+    """
+    retries = config.API_MAX_RETRIES if retries is None else retries
+    backoff = config.API_BACKOFF_SECONDS if backoff is None else backoff
+    statuses = RETRY_STATUS_CODES if statuses is None else statuses
+    for attempt in range(retries + 1):
+        try:
+            return request()
+        except APIError as e:
+            if api_error_status(e) not in statuses or attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+def api_error_status(error):
+    """HTTP status of a gspread APIError"""
+    code = getattr(error, 'code', None)
+    if isinstance(code, int) and code > 0:
+        return code
+    return getattr(error.response, 'status_code', None)
+
+def contiguous_ranges(row_indices):
+    """Merge row indices into sorted (start, end) ranges, end exclusive"""
+    ranges = []
+    for idx in sorted(set(row_indices)):
+        if ranges and ranges[-1][1] == idx:
+            ranges[-1][1] = idx + 1
+        else:
+            ranges.append([idx, idx + 1])
+    return [tuple(r) for r in ranges]
+
+def delete_rows_by_indices(worksheet, row_indices, batch_size=None):
+    """Delete specific rows from worksheet
+
+    Rows are merged into contiguous ranges and sent as deleteDimension
+    requests through spreadsheet.batch_update, batch_size ranges per call.
+    """
+    batch_size = batch_size or config.DELETE_BATCH_SIZE
+    
+    # Delete from bottom to top so earlier requests don't shift later ranges
+    requests = []
+    for start, end in reversed(contiguous_ranges(row_indices)):
+        requests.append({
+            'deleteDimension': {
+                'range': {
+                    'sheetId': worksheet.id,
+                    'dimension': 'ROWS',
+                    # +1 for header row (API ranges are 0-based)
+                    'startIndex': start + 1,
+                    'endIndex': end + 1
+                }
+            }
+        })
     
-    for idx in sorted_indices:
-        # +2 because: +1 for header row, +1 for 1-based indexing
-        worksheet.delete_rows(idx + 2)
+    for i in range(0, len(requests), batch_size):
+        body = {'requests': requests[i:i + batch_size]}
+        call_with_retry(lambda: worksheet.spreadsheet.batch_update(body))
@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+from utils import (
+    build_block_index,
+    extend_block_index,
+    build_column_cache,
+    build_multipass_index,
+    canonical_mobile_series,
+    mobile_suffix_keys,
+    normalize_series
+)
+import config
+
+INDEX_VERSION = 4
+BLOCK_INDEXES = ['mobile', 'mobile_suffix', 'name']
+LAST_USED_FILE = 'last_used.json'
+
+# Indexes loaded ahead of use (warm start) by folder
+_preloaded = {}
+
+def index_cache_key(spreadsheet_id, name_col, mobile_col, addr_col, extra_col):
+    """Folder name for one yearly sheet + column mapping"""
+    mapping = json.dumps([spreadsheet_id, name_col, mobile_col, addr_col, extra_col])
+    return hashlib.sha1(mapping.encode('utf-8')).hexdigest()[:16]
+
+def _selected(name_col, mobile_col, addr_col, extra_col):
+    cols = []
+    for col in [name_col, mobile_col, addr_col, extra_col]:
+        if col != 'None' and col is not None and col not in cols:
+            cols.append(col)
+    return cols
+
+def indexed_row_hashes(df, name_col, mobile_col, addr_col, extra_col):
+    """64-bit hash of the selected columns of every row, used to spot edited yearly rows"""
+    cols = _selected(name_col, mobile_col, addr_col, extra_col)
+    return pd.util.hash_pandas_object(df[cols].astype(str), index=False).to_numpy()
+
+def _index_rows(df_new, index, name_col, mobile_col, addr_col, extra_col):
+    """Normalize new yearly rows and merge them into the index"""
+    normalized = pd.DataFrame({
+        col: normalize_series(df_new[col]).reset_index(drop=True)
+        for col in _selected(name_col, mobile_col, addr_col, extra_col)
+    })
+    
+    mobile_keys, mobile_valid = [], None
+    suffix_keys, suffix_valid = [], None
+    if mobile_col != 'None' and mobile_col is not None:
+        mobile_keys = canonical_mobile_series(df_new[mobile_col])
+        mobile_valid = (mobile_keys != "").to_numpy()
+        suffix_keys, suffix_valid = mobile_suffix_keys(mobile_keys)
+    name_keys, name_valid = [], None
+    if name_col != 'None' and name_col is not None:
+        name_keys = normalized[name_col]
+        name_valid = (name_keys != "").to_numpy()
+    row_hashes = indexed_row_hashes(df_new, name_col, mobile_col, addr_col, extra_col)
+    
+    if index is None:
+        return {
+            'mobile': build_block_index(mobile_keys, mobile_valid),
+            'mobile_suffix': build_block_index(suffix_keys, suffix_valid),
+            'name': build_block_index(name_keys, name_valid),
+            'normalized': normalized,
+            'row_hashes': row_hashes,
+            'rows': len(df_new)
+        }
+    return {
+        'mobile': extend_block_index(index['mobile'], mobile_keys, mobile_valid),
+        'mobile_suffix': extend_block_index(index['mobile_suffix'], suffix_keys, suffix_valid),
+        'name': extend_block_index(index['name'], name_keys, name_valid),
+        'normalized': pd.concat([index['normalized'], normalized], ignore_index=True),
+        'row_hashes': np.concatenate([index['row_hashes'], row_hashes]),
+        'rows': index['rows'] + len(df_new)
+    }
+
+def save_yearly_index(index, path, arrays=None):
+    """Write the index (plus the extra named arrays) as .npy files and a JSON manifest, in a new build folder"""
+    # Mapped files are never rewritten in place, that kills the reader with SIGBUS
+    os.makedirs(path, exist_ok=True)
+    build = f"build-{uuid.uuid4().hex[:12]}"
+    build_path = os.path.join(path, build)
+    os.makedirs(build_path)
+    meta = {
+        'version': INDEX_VERSION,
+        'rows': index['rows'],
+        'build': build,
+        'arrays': sorted(arrays or {}),
+        'keys': {}
+    }
+    for name in BLOCK_INDEXES:
+        block_index = index[name]
+        meta['keys'][name] = list(block_index['keys'])
+        for part in ['codes', 'offsets', 'positions']:
+            np.save(os.path.join(build_path, f"{name}_{part}.npy"), block_index[part])
+    np.save(os.path.join(build_path, 'row_hashes.npy'), index['row_hashes'])
+    for name, values in (arrays or {}).items():
+        np.save(os.path.join(build_path, f"{name}.npy"), values)
+    index['normalized'].to_pickle(os.path.join(build_path, 'normalized.pkl'))
+    
+    # Manifest goes last so a half-written build is never picked up
+    previous = _read_meta(path)
+    tmp_path = os.path.join(path, 'meta.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(path, 'meta.json'))
+    
+    # Unlinking a mapped file is safe, the mapping keeps its pages; the previous
+    # build is kept for readers that are still opening it
+    keep = {build, previous.get('build') if previous else None}
+    for entry in os.listdir(path):
+        if entry.startswith('build-') and entry not in keep:
+            shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+def _read_meta(path):
+    """The manifest of an index folder, or None"""
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def load_yearly_index(path):
+    """Load a saved index, or None if missing or from an older format
+
+    An index preloaded from the same build (preload_yearly_index) is
+    returned as is. index['arrays'] holds the extra arrays of the build.
+    """
+    meta = _read_meta(path)
+    if meta is None or meta.get('version') != INDEX_VERSION:
+        return None
+    preloaded = _preloaded.get(path)
+    if preloaded is not None and preloaded['build'] == meta['build']:
+        return preloaded
+    
+    build_path = os.path.join(path, meta['build'])
+    index = {
+        'rows': meta['rows'],
+        'build': meta['build'],
+        'normalized': pd.read_pickle(os.path.join(build_path, 'normalized.pkl')),
+        'row_hashes': np.load(os.path.join(build_path, 'row_hashes.npy')),
+        'arrays': {name: np.load(os.path.join(build_path, f"{name}.npy")) for name in meta['arrays']}
+    }
+    for name in BLOCK_INDEXES:
+        block_index = {'keys': {key: code for code, key in enumerate(meta['keys'][name])}}
+        for part in ['codes', 'offsets', 'positions']:
+            block_index[part] = np.load(os.path.join(build_path, f"{name}_{part}.npy"), mmap_mode='r')
+        index[name] = block_index
+    return index
+
+def load_or_build_yearly_index(df_yearly, spreadsheet_id, name_col, mobile_col, addr_col, extra_col,
+                               cache_dir=None):
+    """Get the blocking index for df_yearly, reusing the on-disk copy when possible
+
+    Rows up to the stored high-water mark are taken from disk; only rows
+    appended since then are normalized and merged in. If the sheet shrank or
+    any indexed row was edited (per-row hashes), the index is rebuilt from
+    scratch. Returns (index, rows_added).
+    """
+    cache_dir = cache_dir or config.INDEX_CACHE_DIR
+    path = os.path.join(cache_dir, index_cache_key(spreadsheet_id, name_col, mobile_col, addr_col, extra_col))
+    remember_last_used(path, (name_col, mobile_col, addr_col, extra_col), cache_dir)
+    
+    index = load_yearly_index(path)
+    if index is not None:
+        hwm = index['rows']
+        stale = hwm > len(df_yearly) or not np.array_equal(
+            index['row_hashes'], indexed_row_hashes(df_yearly.iloc[:hwm], name_col, mobile_col, addr_col, extra_col))
+        if stale:
+            index = None
+        elif hwm == len(df_yearly):
+            return index, 0
+    
+    start = index['rows'] if index is not None else 0
+    index = _index_rows(df_yearly.iloc[start:], index, name_col, mobile_col, addr_col, extra_col)
+    save_yearly_index(index, path)
+    return index, len(df_yearly) - start
+
+def remember_last_used(path, columns, cache_dir=None):
+    """Note the index folder (and column mapping) of the latest run, for warm starts"""
+    cache_dir = cache_dir or config.INDEX_CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = os.path.join(cache_dir, LAST_USED_FILE + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'folder': os.path.basename(path), 'columns': list(columns)}, f)
+    os.replace(tmp_path, os.path.join(cache_dir, LAST_USED_FILE))
+
+def last_used_index(cache_dir=None):
+    """{'path', 'columns'} of the most recently used yearly index, or None"""
+    cache_dir = cache_dir or config.INDEX_CACHE_DIR
+    try:
+        with open(os.path.join(cache_dir, LAST_USED_FILE)) as f:
+            last_used = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return {'path': os.path.join(cache_dir, last_used['folder']), 'columns': tuple(last_used['columns'])}
+
+def preload_yearly_index(path, columns):
+    """Load a saved index into memory ahead of its first use, with its column cache and multi-pass blocks
+
+    The memory-mapped arrays are read through once so their pages are
+    resident. The column cache and multi-pass index are kept as
+    index['column_cache'] and index['multipass_index'] (valid while the
+    index is not extended). Returns the index, or None.
+    """
+    _preloaded.pop(path, None)
+    index = load_yearly_index(path)
+    if index is None:
+        return None
+    for name in BLOCK_INDEXES:
+        for part in ['codes', 'offsets', 'positions']:
+            np.asarray(index[name][part]).sum()
+    index['column_cache'] = build_column_cache(None, *columns, normalized=index['normalized'])
+    name_col, _, addr_col, extra_col = columns
+    index['multipass_index'] = build_multipass_index(index['column_cache'], name_col, addr_col, extra_col)
+    _preloaded[path] = index
+    return index
+
+def consolidation_path(spreadsheet_id, name_col, mobile_col, addr_col, extra_col, cache_dir=None):
+    """Folder of the consolidated (compacted) index, next to the regular yearly index"""
+    cache_dir = cache_dir or config.INDEX_CACHE_DIR
+    return os.path.join(cache_dir, index_cache_key(spreadsheet_id, name_col, mobile_col, addr_col, extra_col),
+                        'consolidated')
+
+def save_consolidation(consolidation, path):
+    """Write the compacted index, the cluster membership and the row hashes of the consolidated yearly rows"""
+    save_yearly_index(consolidation['index'], path, arrays={
+        'representatives': consolidation['representatives'],
+        'member_offsets': consolidation['member_offsets'],
+        'member_positions': consolidation['member_positions'],
+        'yearly_hashes': consolidation['yearly_hashes']
+    })
+
+def load_consolidation(path):
+    """Load a saved consolidation, or None if missing or from an older format"""
+    index = load_yearly_index(path)
+    if index is None:
+        return None
+    arrays = index['arrays']
+    return {
+        'index': index,
+        'yearly_hashes': arrays['yearly_hashes'],
+        'representatives': arrays['representatives'],
+        'member_offsets': arrays['member_offsets'],
+        'member_positions': arrays['member_positions']
+    }
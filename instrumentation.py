@@ -0,0 +1,88 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+import numpy as np
+
+def new_report():
+    """Empty run report: per-stage timings plus free-form metrics"""
+    return {
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'stages': [],
+        'metrics': {}
+    }
+
+def stage(report, name):
+    """Context manager timing one stage (wall and CPU); no-op when report is None"""
+    if report is None:
+        return nullcontext()
+    return _timed_stage(report, name)
+
+@contextmanager
+def _timed_stage(report, name):
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        report['stages'].append({
+            'stage': name,
+            'wall_seconds': round(time.perf_counter() - wall_start, 4),
+            'cpu_seconds': round(time.process_time() - cpu_start, 4)
+        })
+
+def record(report, key, value):
+    """Store a metric in the report (no-op when report is None)"""
+    if report is not None:
+        report['metrics'][key] = value
+
+def size_summary(sizes):
+    """Count, mean, percentiles and max of a list/array of block sizes"""
+    sizes = np.asarray(sizes)
+    if len(sizes) == 0:
+        return {'count': 0}
+    return {
+        'count': int(len(sizes)),
+        'total': int(sizes.sum()),
+        'mean': round(float(sizes.mean()), 2),
+        'p50': float(np.percentile(sizes, 50)),
+        'p90': float(np.percentile(sizes, 90)),
+        'p99': float(np.percentile(sizes, 99)),
+        'max': int(sizes.max())
+    }
+
+def largest_blocks(block_index, top=10):
+    """The top largest blocks of a CSR block index as [{'key', 'size'}]"""
+    sizes = np.diff(block_index['offsets'])
+    if len(sizes) == 0:
+        return []
+    keys = list(block_index['keys'])
+    order = np.argsort(-sizes, kind='stable')[:top]
+    return [{'key': keys[code], 'size': int(sizes[code])} for code in order]
+
+def record_block_stats(report, yearly_index):
+    """Block size distribution and largest blocks of the mobile and name indexes"""
+    if report is None:
+        return
+    for name in ['mobile', 'mobile_suffix', 'name']:
+        block_index = yearly_index[name]
+        record(report, f"{name}_blocks", size_summary(np.diff(block_index['offsets'])))
+        record(report, f"{name}_largest_blocks", largest_blocks(block_index))
+
+def record_match_stats(report, matches, stats, daily_rows):
+    """Comparisons per daily row and the exact vs fuzzy hit ratio (matches: a match table)"""
+    if report is None:
+        return
+    matched = len(matches['is_exact'])
+    exact = int(matches['is_exact'].sum())
+    comparisons = stats['candidates_scored'] + stats['batch_pairs']
+    record(report, 'matcher', dict(stats))
+    record(report, 'comparisons_per_daily_row', round(comparisons / daily_rows, 2) if daily_rows else 0)
+    record(report, 'exact_matches', exact)
+    record(report, 'fuzzy_matches', matched - exact)
+    record(report, 'exact_hit_ratio', round(exact / matched, 4) if matched else 0)
+
+def write_report(report, path):
+    """Write the run report as JSON"""
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
@@ -1,15 +1,113 @@
-from rapidfuzz import fuzz
-from utils import normalize, get_block_key
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+from utils import lookup_block
 import config
 
-def check_exact_match(daily_row, yearly_row, name_col, mobile_col, addr_col, extra_col):
-    """Check if names match exactly and categorize by column matches"""
+# Match categories, stored in match tables as int8 codes (index into this list)
+MATCH_TYPES = ['🟢 PERFECT', '🟢 STRONG', '🟢 PARTIAL', '🟢 WEAK', '🔴 HIGH', '🟡 MEDIUM', '⚪ LOW']
+MATCH_TYPE_CODES = {match_type: code for code, match_type in enumerate(MATCH_TYPES)}
+PERFECT = MATCH_TYPE_CODES['🟢 PERFECT']
+
+# Columns of a match table: one entry per matched daily row. For exact
+# matches the colN_match flags say which other columns were equal too, and
+# the percentages are 100 for equal columns, 0 otherwise.
+MATCH_FIELDS = {
+    'daily_pos': np.int32,
+    'yearly_pos': np.int32,
+    'score': np.int16,
+    'category': np.int8,
+    'is_exact': bool,
+    'col1_pct': np.float64,
+    'col2_match': bool,
+    'col3_pct': np.float64,
+    'col3_match': bool,
+    'col4_pct': np.float64,
+    'col4_match': bool
+}
+
+def new_matches(n=0, **fields):
+    """Match table of n rows; each field is an array or a scalar for all rows, missing fields are 0/False"""
+    table = {}
+    for field, dtype in MATCH_FIELDS.items():
+        values = fields.get(field, 0)
+        if np.ndim(values) == 0:
+            table[field] = np.full(n, values, dtype=dtype)
+        else:
+            table[field] = np.asarray(values, dtype=dtype)
+    return table
+
+def exact_match_fields(mobile_match, addr_match, extra_match):
+    """Match table fields shared by all exact matches"""
+    addr_match = np.asarray(addr_match, dtype=bool)
+    extra_match = np.asarray(extra_match, dtype=bool)
+    return {
+        'score': 100,
+        'is_exact': True,
+        'col1_pct': 100,
+        'col2_match': mobile_match,
+        'col3_pct': addr_match * 100.0,
+        'col3_match': addr_match,
+        'col4_pct': extra_match * 100.0,
+        'col4_match': extra_match
+    }
+
+def matches_from_records(daily_positions, records):
+    """Match table from find_best_match results (None entries are left out)"""
+    kept = [(pos, m) for pos, m in zip(daily_positions, records) if m]
+    
+    def field(get):
+        return [get(m) for _, m in kept]
+    
+    is_exact = np.array(field(lambda m: m['is_exact']), dtype=bool)
+    exact = exact_match_fields(field(lambda m: m.get('mobile_match', False)),
+                               field(lambda m: m.get('addr_match', False)),
+                               field(lambda m: m.get('extra_match', False)))
+    fuzzy = {
+        'col1_pct': field(lambda m: m.get('col1_pct', 0)),
+        'col2_match': field(lambda m: m.get('col2_match', False)),
+        'col3_pct': field(lambda m: m.get('col3_pct', 0)),
+        'col3_match': False,
+        'col4_pct': field(lambda m: m.get('col4_pct', 0)),
+        'col4_match': False
+    }
+    return new_matches(
+        len(kept),
+        daily_pos=[pos for pos, _ in kept],
+        yearly_pos=field(lambda m: m['yearly_pos']),
+        score=field(lambda m: m['score']),
+        category=field(lambda m: MATCH_TYPE_CODES[m['match_type']]),
+        is_exact=is_exact,
+        **{name: np.where(is_exact, exact[name], fuzzy[name]) for name in fuzzy}
+    )
+
+def take_matches(table, rows):
+    """Subset of a match table (rows: positions or a boolean mask)"""
+    return {field: values[rows] for field, values in table.items()}
+
+def concat_matches(tables):
+    """One match table from several, sorted by daily position"""
+    tables = list(tables)
+    if not tables:
+        return new_matches()
+    table = {field: np.concatenate([t[field] for t in tables]) for field in tables[0]}
+    return take_matches(table, np.argsort(table['daily_pos'], kind='stable'))
+
+def equality_form(cache, col):
+    """Cache form two values of col are compared on for equality ('canonical' numbers for the mobile column)"""
+    return 'canonical' if 'canonical' in cache[col] else 'norm'
+
+def check_exact_match(daily_cache, daily_pos, yearly_cache, yearly_pos, name_col, mobile_col, addr_col, extra_col):
+    """Check if names match exactly and categorize by column matches
+
+    Rows are given as positions into column caches (utils.build_column_cache).
+    """
     # Handle None columns
     if name_col == 'None' or name_col is None:
         return None
     
-    daily_name = normalize(daily_row[name_col])
-    yearly_name = normalize(yearly_row[name_col])
+    daily_name = daily_cache[name_col]['norm'][daily_pos]
+    yearly_name = yearly_cache[name_col]['norm'][yearly_pos]
     
     if daily_name != yearly_name or daily_name == "":
         return None
@@ -19,19 +117,20 @@ def check_exact_match(daily_row, yearly_row, name_col, mobile_col, addr_col, ext
     
     mobile_match = False
     if mobile_col != 'None' and mobile_col is not None:
-        mobile_match = normalize(daily_row[mobile_col]) == normalize(yearly_row[mobile_col])
+        form = equality_form(daily_cache, mobile_col)
+        mobile_match = daily_cache[mobile_col][form][daily_pos] == yearly_cache[mobile_col][form][yearly_pos]
         if mobile_match:
             exact_col_count += 1
     
     addr_match = False
     if addr_col != 'None' and addr_col is not None:
-        addr_match = normalize(daily_row[addr_col]) == normalize(yearly_row[addr_col])
+        addr_match = daily_cache[addr_col]['norm'][daily_pos] == yearly_cache[addr_col]['norm'][yearly_pos]
         if addr_match:
             exact_col_count += 1
     
     extra_match = False
     if extra_col != 'None' and extra_col is not None:
-        extra_match = normalize(daily_row[extra_col]) == normalize(yearly_row[extra_col])
+        extra_match = daily_cache[extra_col]['norm'][daily_pos] == yearly_cache[extra_col]['norm'][yearly_pos]
         if extra_match:
             exact_col_count += 1
     
@@ -44,19 +143,12 @@ def check_exact_match(daily_row, yearly_row, name_col, mobile_col, addr_col, ext
     if extra_col != 'None' and extra_col is not None:
         selected_count += 1
     
-    if exact_col_count == selected_count:
-        match_category = '🟢 PERFECT'
-    elif exact_col_count >= selected_count * 0.75:
-        match_category = '🟢 STRONG'
-    elif exact_col_count >= selected_count * 0.5:
-        match_category = '🟢 PARTIAL'
-    else:
-        match_category = '🟢 WEAK'
+    match_category = _exact_category(exact_col_count, selected_count)
     
     return {
         'score': 100,
         'match_type': match_category,
-        'yearly_row': yearly_row,
+        'yearly_pos': int(yearly_pos),
         'mobile_match': mobile_match,
         'addr_match': addr_match,
         'extra_match': extra_match,
@@ -64,67 +156,95 @@ def check_exact_match(daily_row, yearly_row, name_col, mobile_col, addr_col, ext
         'is_exact': True
     }
 
-def check_fuzzy_match(daily_row, yearly_row, name_col, mobile_col, addr_col, extra_col):
-    """Calculate fuzzy match score"""
-    score = 0
-    total_weight = 0
+def _fuzzy_columns(name_col, mobile_col, addr_col, extra_col):
+    """Selected columns as (key, column, weight, scorer, cache form) in pruning order
+
+    Mobile goes first because an equality check (on the canonical numbers)
+    is cheap, the fuzzy columns follow by weight so the score bound tightens
+    as fast as possible. Names use ratio on the pre-sorted forms, which
+    equals token_sort_ratio.
+    """
+    columns = [
+        ('col2', mobile_col, config.SCORE_COL2_WEIGHT, None, 'canonical'),
+        ('col1', name_col, config.SCORE_COL1_WEIGHT, fuzz.ratio, 'sorted'),
+        ('col3', addr_col, config.SCORE_COL3_WEIGHT, fuzz.token_set_ratio, 'norm'),
+        ('col4', extra_col, config.SCORE_COL4_WEIGHT, fuzz.token_set_ratio, 'norm')
+    ]
+    columns = [c for c in columns if c[1] != 'None' and c[1] is not None]
+    return sorted(columns, key=lambda c: (c[3] is not None, -c[2]))
+
+def check_fuzzy_match(daily_cache, daily_pos, yearly_cache, yearly_pos, name_col, mobile_col, addr_col, extra_col,
+                      best_score=0, stats=None):
+    """Calculate fuzzy match score
+
+    Returns None as soon as the best possible weighted score can no longer
+    reach THRESHOLD_LOW or beat best_score. stats (optional dict) counts the
+    column comparisons made and skipped.
+    """
+    columns = _fuzzy_columns(name_col, mobile_col, addr_col, extra_col)
+    total_weight = sum(c[2] for c in columns)
+    
+    # Smallest weighted score that still rounds above best_score (small slack for float error)
+    needed = max(config.THRESHOLD_LOW, best_score + 0.5) * total_weight / 100 - 1e-9
+    
+    values = {'col1': 0, 'col2': False, 'col3': 0, 'col4': 0}
+    upper_bound = total_weight
+    for n, (key, col, weight, scorer, form) in enumerate(columns):
+        daily_value = daily_cache[col][form][daily_pos]
+        yearly_value = yearly_cache[col][form][yearly_pos]
+        if scorer is None:
+            values[key] = (daily_value == yearly_value)
+            upper_bound -= 0 if values[key] else weight
+        else:
+            # Ratios below the cutoff cannot lift the pair over `needed`, rapidfuzz returns 0 for them
+            cutoff = max(0, (needed - (upper_bound - weight)) / weight * 100 - 1e-6)
+            values[key] = scorer(daily_value, yearly_value, score_cutoff=cutoff)
+            upper_bound -= weight - (values[key] / 100) * weight
+        
+        if stats is not None:
+            stats['columns_compared'] += 1
+        if upper_bound < needed:
+            if stats is not None:
+                stats['columns_skipped'] += len(columns) - n - 1
+                stats['candidates_pruned'] += 1
+            return None
     
-    col1_pct = 0
-    col2_match = False
-    col3_pct = 0
-    col4_pct = 0
+    # Same accumulation order as before so scores round identically
+    col1_pct = values['col1']
+    col2_match = values['col2']
+    col3_pct = values['col3']
+    col4_pct = values['col4']
+    score = 0
     
     # Column 1 - Name
     if name_col != 'None' and name_col is not None:
-        daily_name = normalize(daily_row[name_col])
-        yearly_name = normalize(yearly_row[name_col])
-        col1_pct = fuzz.token_sort_ratio(daily_name, yearly_name)
         score += (col1_pct / 100) * config.SCORE_COL1_WEIGHT
-        total_weight += config.SCORE_COL1_WEIGHT
     
     # Column 2 - Mobile (exact match only)
-    if mobile_col != 'None' and mobile_col is not None:
-        daily_mobile = normalize(daily_row[mobile_col])
-        yearly_mobile = normalize(yearly_row[mobile_col])
-        col2_match = (daily_mobile == yearly_mobile)
-        if col2_match:
-            score += config.SCORE_COL2_WEIGHT
-        total_weight += config.SCORE_COL2_WEIGHT
+    if col2_match:
+        score += config.SCORE_COL2_WEIGHT
     
     # Column 3 - Address
     if addr_col != 'None' and addr_col is not None:
-        daily_addr = normalize(daily_row[addr_col])
-        yearly_addr = normalize(yearly_row[addr_col])
-        col3_pct = fuzz.token_set_ratio(daily_addr, yearly_addr)
         score += (col3_pct / 100) * config.SCORE_COL3_WEIGHT
-        total_weight += config.SCORE_COL3_WEIGHT
     
     # Column 4 - Extra
     if extra_col != 'None' and extra_col is not None:
-        daily_extra = normalize(daily_row[extra_col])
-        yearly_extra = normalize(yearly_row[extra_col])
-        col4_pct = fuzz.token_set_ratio(daily_extra, yearly_extra)
         score += (col4_pct / 100) * config.SCORE_COL4_WEIGHT
-        total_weight += config.SCORE_COL4_WEIGHT
     
     # Normalize score to 100 scale based on selected columns
     if total_weight > 0:
         score = (score / total_weight) * 100
     
     # Categorize
-    if score >= config.THRESHOLD_HIGH:
-        match_type = '🔴 HIGH'
-    elif score >= config.THRESHOLD_MEDIUM:
-        match_type = '🟡 MEDIUM'
-    elif score >= config.THRESHOLD_LOW:
-        match_type = '⚪ LOW'
-    else:
+    if score < config.THRESHOLD_LOW:
         return None
+    match_type = _fuzzy_category(score)
     
     return {
         'score': round(score),
         'match_type': match_type,
-        'yearly_row': yearly_row,
+        'yearly_pos': int(yearly_pos),
         'col1_pct': col1_pct,
         'col2_match': col2_match,
         'col3_pct': col3_pct,
@@ -134,23 +254,309 @@ def check_fuzzy_match(daily_row, yearly_row, name_col, mobile_col, addr_col, ext
         'is_exact': False
     }
 
-def find_best_match(daily_row, candidates, name_col, mobile_col, addr_col, extra_col):
-    """Find best match from candidates"""
+def find_exact_duplicates(daily_cache, yearly_cache, name_col, mobile_col, addr_col, extra_col, name_blocks=None):
+    """All (daily, yearly) pairs with equal normalized names, with their match columns (check_exact_match rules)"""
+    columns = ['daily_pos', 'yearly_pos', 'mobile_match', 'addr_match', 'extra_match',
+               'exact_col_count', 'match_type']
+    if name_col == 'None' or name_col is None:
+        return pd.DataFrame(columns=columns)
+    
+    others = [('mobile_match', mobile_col), ('addr_match', addr_col), ('extra_match', extra_col)]
+    others = [(key, col) for key, col in others if col != 'None' and col is not None]
+    
+    def side(cache, pos_name):
+        frame = pd.DataFrame({'name': cache[name_col]['norm']}, dtype=object)
+        frame[pos_name] = np.arange(len(frame))
+        for key, col in others:
+            frame[key] = cache[col][equality_form(cache, col)]
+        return frame[frame['name'] != ""]
+    
+    if name_blocks is None:
+        pairs = side(daily_cache, 'daily_pos').merge(side(yearly_cache, 'yearly_pos'), on='name',
+                                                     suffixes=('_d', '_y'))
+    else:
+        # Looked up per daily row, so the cost follows the daily sheet instead of the yearly one
+        pairs = _block_pairs(daily_cache, yearly_cache, name_col, others, name_blocks)
+    
+    exact_col_count = np.ones(len(pairs), dtype=np.int64)  # Name always matches
+    result = pd.DataFrame({'daily_pos': pairs['daily_pos'].to_numpy(),
+                           'yearly_pos': pairs['yearly_pos'].to_numpy()})
+    for key in ['mobile_match', 'addr_match', 'extra_match']:
+        if f"{key}_d" in pairs:
+            result[key] = (pairs[f"{key}_d"] == pairs[f"{key}_y"]).to_numpy()
+            exact_col_count += result[key].to_numpy()
+        else:
+            result[key] = False
+    result['exact_col_count'] = exact_col_count
+    
+    codes = _exact_category_codes(exact_col_count, 1 + len(others))
+    result['match_type'] = np.asarray(MATCH_TYPES, dtype=object)[codes]
+    return result.sort_values(['daily_pos', 'yearly_pos'], ignore_index=True)[columns]
+
+def _block_pairs(daily_cache, yearly_cache, name_col, others, name_blocks):
+    """Same pairs as the merge in find_exact_duplicates, from name block lookups"""
+    daily_pos = []
+    yearly_pos = []
+    for pos, name in enumerate(daily_cache[name_col]['norm']):
+        if name:
+            block = lookup_block(name_blocks, name).tolist()
+            daily_pos.extend([pos] * len(block))
+            yearly_pos.extend(block)
+    
+    pairs = pd.DataFrame({'daily_pos': np.asarray(daily_pos, dtype=np.int64),
+                          'yearly_pos': np.asarray(yearly_pos, dtype=np.int64)})
+    for key, col in others:
+        daily_values = daily_cache[col][equality_form(daily_cache, col)]
+        yearly_values = yearly_cache[col][equality_form(yearly_cache, col)]
+        pairs[f"{key}_d"] = pd.Series([daily_values[p] for p in daily_pos], dtype=object)
+        pairs[f"{key}_y"] = pd.Series([yearly_values[p] for p in yearly_pos], dtype=object)
+    return pairs
+
+def new_match_stats():
+    """Counters filled in by find_best_match"""
+    return {
+        'candidates_scored': 0,
+        'candidates_skipped': 0,
+        'candidates_pruned': 0,
+        'columns_compared': 0,
+        'columns_skipped': 0
+    }
+
+def find_best_match(daily_cache, daily_pos, yearly_cache, candidate_positions,
+                    name_col, mobile_col, addr_col, extra_col, stats=None):
+    """Find best match for daily row daily_pos among the yearly rows at candidate_positions
+
+    Stops at the first score-100 match (nothing can beat it) and prunes
+    fuzzy candidates that cannot beat the current best. stats (optional,
+    see new_match_stats) collects how much work was skipped.
+    """
     best_match = None
     best_score = 0
     
-    for yearly_row in candidates:
+    for n, yearly_pos in enumerate(candidate_positions):
+        if best_score >= 100:
+            if stats is not None:
+                stats['candidates_skipped'] += len(candidate_positions) - n
+            break
+        if stats is not None:
+            stats['candidates_scored'] += 1
+        
         # Try exact match first
-        exact = check_exact_match(daily_row, yearly_row, name_col, mobile_col, addr_col, extra_col)
+        exact = check_exact_match(daily_cache, daily_pos, yearly_cache, yearly_pos,
+                                  name_col, mobile_col, addr_col, extra_col)
         if exact and exact['score'] > best_score:
             best_match = exact
             best_score = exact['score']
             continue
         
         # Try fuzzy match
-        fuzzy = check_fuzzy_match(daily_row, yearly_row, name_col, mobile_col, addr_col, extra_col)
+        fuzzy = check_fuzzy_match(daily_cache, daily_pos, yearly_cache, yearly_pos,
+                                  name_col, mobile_col, addr_col, extra_col,
+                                  best_score=best_score, stats=stats)
         if fuzzy and fuzzy['score'] > best_score:
             best_match = fuzzy
             best_score = fuzzy['score']
     
     return best_match
+
+def score_pairs(cache, pairs, name_col, mobile_col, addr_col, extra_col, min_score=None, link_types=None,
+                min_exact_cols=None, stats=None):
+    """Match table of the linked (i, j) pairs of one column cache (a self-join)
+
+    A pair is linked when its exact match is one of link_types (or, with
+    min_exact_cols, has that many equal columns), or else its fuzzy score
+    reaches min_score. daily_pos holds i and yearly_pos j.
+    """
+    min_score = config.SELF_JOIN_MIN_SCORE if min_score is None else min_score
+    link_types = config.SELF_JOIN_EXACT_TYPES if link_types is None else link_types
+    columns = (name_col, mobile_col, addr_col, extra_col)
+    first = []
+    records = []
+    for i, j in pairs.tolist():
+        if stats is not None:
+            stats['candidates_scored'] += 1
+        match = check_exact_match(cache, i, cache, j, *columns)
+        if match is not None and min_exact_cols is not None:
+            linked = match['exact_col_count'] >= min_exact_cols
+        else:
+            linked = match is not None and match['match_type'] in link_types
+        if not linked:
+            # Anything rounding below min_score is pruned early
+            match = check_fuzzy_match(cache, i, cache, j, *columns, best_score=min_score - 1, stats=stats)
+        if match is not None:
+            first.append(i)
+            records.append(match)
+    return matches_from_records(first, records)
+
+def _is_selected(col):
+    return col != 'None' and col is not None
+
+def _column_codes(daily_values, yearly_values):
+    """Integer codes shared by both sides so equality becomes an int compare"""
+    codes, _ = pd.factorize(pd.Series(daily_values + yearly_values, dtype=object))
+    return codes[:len(daily_values)], codes[len(daily_values):]
+
+def find_best_matches_batch(daily_cache, daily_positions, yearly_cache, candidate_positions,
+                            name_col, mobile_col, addr_col, extra_col, workers=-1):
+    """Find best match for every daily row in a block against one shared candidate block
+
+    Same results as calling find_best_match row by row, but each column is scored
+    for the whole block with rapidfuzz.process.cdist and combined with NumPy.
+    workers is passed on to cdist.
+    Returns a match table (see MATCH_FIELDS) of the daily rows that matched.
+    """
+    if len(daily_positions) == 0 or len(candidate_positions) == 0:
+        return new_matches()
+    daily_positions = np.asarray(daily_positions)
+    
+    # Block slices of every cached form, keyed by (column, form)
+    daily_norm = {}
+    yearly_norm = {}
+    for col in daily_cache:
+        for form in daily_cache[col]:
+            daily_norm[col, form] = [daily_cache[col][form][p] for p in daily_positions]
+            yearly_norm[col, form] = [yearly_cache[col][form][p] for p in candidate_positions]
+    
+    # Bound the size of the similarity matrices
+    tables = []
+    chunk = max(1, config.BATCH_MAX_CELLS // len(candidate_positions))
+    for start in range(0, len(daily_positions), chunk):
+        stop = min(start + chunk, len(daily_positions))
+        block_daily = {col: values[start:stop] for col, values in daily_norm.items()}
+        table = _score_chunk(block_daily, yearly_norm, candidate_positions,
+                             name_col, mobile_col, addr_col, extra_col, workers)
+        table['daily_pos'] = daily_positions[start + table['daily_pos']]
+        tables.append(table)
+    return concat_matches(tables)
+
+def _score_chunk(daily_norm, yearly_norm, candidate_positions,
+                 name_col, mobile_col, addr_col, extra_col, workers):
+    """Match table for one chunk; daily_pos holds row numbers within the chunk"""
+    n_daily = len(next(iter(daily_norm.values())))
+    shape = (n_daily, len(candidate_positions))
+    
+    score = np.zeros(shape)
+    total_weight = 0
+    col1_pct = col3_pct = col4_pct = None
+    col2_match = None
+    equal = {}
+    
+    def equality(col):
+        if col not in equal:
+            form = 'canonical' if (col, 'canonical') in daily_norm else 'norm'
+            daily_codes, yearly_codes = _column_codes(daily_norm[col, form], yearly_norm[col, form])
+            equal[col] = daily_codes[:, None] == yearly_codes[None, :]
+        return equal[col]
+    
+    def similarity(col, scorer, form='norm'):
+        return process.cdist(daily_norm[col, form], yearly_norm[col, form], scorer=scorer,
+                             dtype=np.float64, workers=workers)
+    
+    # Same accumulation order as check_fuzzy_match so scores round identically
+    if _is_selected(name_col):
+        col1_pct = similarity(name_col, fuzz.ratio, 'sorted')
+        score += (col1_pct / 100) * config.SCORE_COL1_WEIGHT
+        total_weight += config.SCORE_COL1_WEIGHT
+    
+    if _is_selected(mobile_col):
+        col2_match = equality(mobile_col)
+        score[col2_match] += config.SCORE_COL2_WEIGHT
+        total_weight += config.SCORE_COL2_WEIGHT
+    
+    if _is_selected(addr_col):
+        col3_pct = similarity(addr_col, fuzz.token_set_ratio)
+        score += (col3_pct / 100) * config.SCORE_COL3_WEIGHT
+        total_weight += config.SCORE_COL3_WEIGHT
+    
+    if _is_selected(extra_col):
+        col4_pct = similarity(extra_col, fuzz.token_set_ratio)
+        score += (col4_pct / 100) * config.SCORE_COL4_WEIGHT
+        total_weight += config.SCORE_COL4_WEIGHT
+    
+    if total_weight > 0:
+        score = (score / total_weight) * 100
+    
+    # Exact name matches score 100, fuzzy matches below THRESHOLD_LOW do not count
+    pair_score = np.where(score >= config.THRESHOLD_LOW, np.round(score), 0)
+    exact = None
+    if _is_selected(name_col):
+        daily_has_name = np.array([name != "" for name in daily_norm[name_col, 'norm']])
+        exact = equality(name_col) & daily_has_name[:, None]
+        pair_score = np.where(exact, 100, pair_score)
+    
+    # argmax keeps the first candidate on ties, like the strict > in find_best_match
+    best = np.argmax(pair_score, axis=1)
+    rows = np.flatnonzero(pair_score[np.arange(n_daily), best] > 0)
+    best = best[rows]
+    n = len(rows)
+    
+    def pick(matrix, default):
+        return matrix[rows, best] if matrix is not None else np.full(n, default)
+    
+    def picked_equality(col):
+        return equality(col)[rows, best] if _is_selected(col) else np.zeros(n, dtype=bool)
+    
+    is_exact = pick(exact, False)
+    mobile_match = picked_equality(mobile_col)
+    addr_match = picked_equality(addr_col) & is_exact
+    extra_match = picked_equality(extra_col) & is_exact
+    
+    selected_count = 1 + sum(_is_selected(col) for col in (mobile_col, addr_col, extra_col))
+    exact_col_count = 1 + mobile_match.astype(np.int64) + addr_match + extra_match
+    category = np.where(is_exact, _exact_category_codes(exact_col_count, selected_count),
+                        _fuzzy_category_codes(pick(score, 0.0)))
+    
+    exact_fields = exact_match_fields(mobile_match, addr_match, extra_match)
+    fuzzy_fields = {
+        'col1_pct': pick(col1_pct, 0.0),
+        'col3_pct': pick(col3_pct, 0.0),
+        'col4_pct': pick(col4_pct, 0.0)
+    }
+    return new_matches(
+        n,
+        daily_pos=rows,
+        yearly_pos=np.asarray(candidate_positions)[best],
+        score=pick(pair_score, 0),
+        category=category,
+        is_exact=is_exact,
+        col1_pct=np.where(is_exact, exact_fields['col1_pct'], fuzzy_fields['col1_pct']),
+        col2_match=mobile_match,
+        col3_pct=np.where(is_exact, exact_fields['col3_pct'], fuzzy_fields['col3_pct']),
+        col3_match=addr_match,
+        col4_pct=np.where(is_exact, exact_fields['col4_pct'], fuzzy_fields['col4_pct']),
+        col4_match=extra_match
+    )
+
+def _exact_category_codes(exact_col_count, selected_count):
+    """Vectorized _exact_category, as MATCH_TYPES codes"""
+    return np.select(
+        [exact_col_count == selected_count,
+         exact_col_count >= selected_count * 0.75,
+         exact_col_count >= selected_count * 0.5],
+        [MATCH_TYPE_CODES['🟢 PERFECT'], MATCH_TYPE_CODES['🟢 STRONG'], MATCH_TYPE_CODES['🟢 PARTIAL']],
+        default=MATCH_TYPE_CODES['🟢 WEAK']
+    )
+
+def _fuzzy_category_codes(score):
+    """Vectorized _fuzzy_category, as MATCH_TYPES codes"""
+    return np.select(
+        [score >= config.THRESHOLD_HIGH, score >= config.THRESHOLD_MEDIUM],
+        [MATCH_TYPE_CODES['🔴 HIGH'], MATCH_TYPE_CODES['🟡 MEDIUM']],
+        default=MATCH_TYPE_CODES['⚪ LOW']
+    )
+
+def _exact_category(exact_col_count, selected_count):
+    if exact_col_count == selected_count:
+        return '🟢 PERFECT'
+    elif exact_col_count >= selected_count * 0.75:
+        return '🟢 STRONG'
+    elif exact_col_count >= selected_count * 0.5:
+        return '🟢 PARTIAL'
+    return '🟢 WEAK'
+
+def _fuzzy_category(score):
+    if score >= config.THRESHOLD_HIGH:
+        return '🔴 HIGH'
+    elif score >= config.THRESHOLD_MEDIUM:
+        return '🟡 MEDIUM'
+    return '⚪ LOW'
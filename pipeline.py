@@ -0,0 +1,673 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from utils import (
+    lookup_block,
+    block_size,
+    canonical_mobile_series,
+    mobile_suffix_keys,
+    build_column_cache,
+    build_multipass_index,
+    multipass_candidates,
+    self_join_pairs,
+    self_join_indexes,
+    run_concurrently
+)
+from matcher import (
+    find_best_match,
+    find_best_matches_batch,
+    find_exact_duplicates,
+    new_match_stats,
+    new_matches,
+    exact_match_fields,
+    matches_from_records,
+    take_matches,
+    concat_matches,
+    score_pairs,
+    MATCH_TYPES,
+    PERFECT
+)
+from index_store import load_or_build_yearly_index, _index_rows
+from consolidate import load_compact_yearly, linked_records
+from instrumentation import (
+    new_report,
+    stage,
+    record,
+    size_summary,
+    record_block_stats,
+    record_match_stats,
+    write_report
+)
+import config
+
+def split_source(source):
+    """(location, tab) of a source written as 'location' or 'location::Tab name'"""
+    location, _, tab = source.partition('::')
+    return location, tab or None
+
+def load_frame(source, client=None):
+    """Read a local CSV/Parquet file or a Google Sheet URL (first tab, or 'URL::Tab name')
+
+    Returns (DataFrame, source_id); source_id keys the persistent yearly index.
+    """
+    location, tab = split_source(source)
+    lowered = location.lower()
+    if lowered.endswith('.csv'):
+        return pd.read_csv(location, dtype=str, keep_default_na=False), os.path.abspath(location)
+    if lowered.endswith('.parquet'):
+        return pd.read_parquet(location), os.path.abspath(location)
+    
+    if client is None:
+        raise ValueError(f"Reading {source} needs Google credentials")
+    from google_sheets import get_sheet_by_url, read_sheet_to_df
+    spreadsheet = get_sheet_by_url(client, location)
+    if tab is None:
+        return read_sheet_to_df(spreadsheet.sheet1), spreadsheet.id
+    worksheet = spreadsheet.worksheet(tab)
+    return read_sheet_to_df(worksheet), f"{spreadsheet.id}:{worksheet.id}"
+
+def assign_blocks(df_daily, daily_cache, yearly_cache, yearly_index, name_col, mobile_col, addr_col, extra_col,
+                  skip=(), multipass_index=None):
+    """Candidate blocks for the daily rows (except skip) as a list of (group_key, candidates, daily_positions)"""
+    if mobile_col != 'None':
+        daily_mobiles = canonical_mobile_series(df_daily[mobile_col])
+        suffixes, suffix_valid = mobile_suffix_keys(daily_mobiles)
+        daily_mobiles, suffixes = daily_mobiles.tolist(), suffixes.tolist()
+    if name_col != 'None':
+        daily_names = daily_cache[name_col]['norm']
+    mobile_groups = {}
+    multipass_groups = {}
+    for i in range(len(df_daily)):
+        if i in skip:
+            continue
+        # Try mobile blocking first if mobile column selected: exact number, then suffix
+        if mobile_col != 'None':
+            if daily_mobiles[i] in yearly_index['mobile']['keys']:
+                mobile_groups.setdefault(('mobile', daily_mobiles[i]), []).append(i)
+                continue
+            size = block_size(yearly_index['mobile_suffix'], suffixes[i]) if suffix_valid[i] else 0
+            if 0 < size <= config.MOBILE_SUFFIX_MAX_BLOCK:
+                mobile_groups.setdefault(('mobile_suffix', suffixes[i]), []).append(i)
+                continue
+            # A valid number found in neither block: exact name block only
+            if suffix_valid[i] and not config.MULTIPASS_FOR_UNKNOWN_MOBILES:
+                if name_col != 'None' and daily_names[i] in yearly_index['name']['keys']:
+                    mobile_groups.setdefault(('name', daily_names[i]), []).append(i)
+                continue
+        
+        # Otherwise fall back to the multi-pass blocks (built on first use)
+        if multipass_index is None:
+            multipass_index = build_multipass_index(yearly_cache, name_col, addr_col, extra_col)
+        candidates = multipass_candidates(multipass_index, yearly_index['name'], daily_cache, i,
+                                          name_col, addr_col, extra_col)
+        if len(candidates):
+            group = multipass_groups.setdefault(candidates.tobytes(), (candidates, []))
+            group[1].append(i)
+    
+    blocks = [((kind, key), lookup_block(yearly_index[kind], key), daily_positions)
+              for (kind, key), daily_positions in mobile_groups.items()]
+    blocks.extend((('multi', n), candidates, daily_positions)
+                  for n, (candidates, daily_positions) in enumerate(multipass_groups.values()))
+    return blocks
+
+def shard_blocks(blocks, n_shards):
+    """Split blocks into n_shards lists of similar total work (deterministic)"""
+    shards = [[] for _ in range(n_shards)]
+    loads = [0] * n_shards
+    # Most pairs first, ties kept in block order, each onto the lightest shard
+    ordered = sorted(enumerate(blocks), key=lambda item: (-len(item[1][1]) * len(item[1][2]), item[0]))
+    for _, block in ordered:
+        target = loads.index(min(loads))
+        shards[target].append(block)
+        loads[target] += len(block[1]) * len(block[2])
+    return [shard for shard in shards if shard]
+
+def score_blocks(blocks, daily_cache, yearly_cache, name_col, mobile_col, addr_col, extra_col,
+                 scorer_workers=-1, stats=None):
+    """Score a list of (group_key, candidates, daily_positions) blocks; returns a match table
+
+    Small blocks go through find_best_match (pruned pair-by-pair scoring),
+    larger ones through the cdist batch scorer. Both give the same matches.
+    """
+    tables = []
+    small_positions = []
+    small_matches = []
+    for _, candidates, daily_positions in blocks:
+        if len(daily_positions) * len(candidates) < config.BATCH_MIN_CELLS:
+            small_positions.extend(daily_positions)
+            small_matches.extend(
+                find_best_match(daily_cache, daily_pos, yearly_cache, candidates,
+                                name_col, mobile_col, addr_col, extra_col, stats=stats)
+                for daily_pos in daily_positions
+            )
+        else:
+            tables.append(find_best_matches_batch(daily_cache, daily_positions, yearly_cache, candidates,
+                                                  name_col, mobile_col, addr_col, extra_col,
+                                                  workers=scorer_workers))
+            if stats is not None:
+                stats['batch_pairs'] += len(daily_positions) * len(candidates)
+    tables.append(matches_from_records(small_positions, small_matches))
+    return concat_matches(tables)
+
+def new_run_stats():
+    """Counters for one duplicate run (pruning counters from the matcher + batch pairs)"""
+    stats = new_match_stats()
+    stats['batch_pairs'] = 0
+    stats['exact_settled'] = 0
+    return stats
+
+def settle_perfect_matches(daily_cache, yearly_cache, name_col, mobile_col, addr_col, extra_col, name_blocks=None):
+    """Match table for daily rows that have a PERFECT yearly duplicate, from one hash join
+
+    These rows need no fuzzy scoring. When several yearly rows are perfect
+    duplicates, the first one (lowest yearly position) is reported.
+    """
+    exact_pairs = find_exact_duplicates(daily_cache, yearly_cache, name_col, mobile_col, addr_col, extra_col,
+                                        name_blocks=name_blocks)
+    perfect = exact_pairs[exact_pairs['match_type'] == '🟢 PERFECT'].drop_duplicates('daily_pos')
+    return new_matches(
+        len(perfect),
+        daily_pos=perfect['daily_pos'].to_numpy(),
+        yearly_pos=perfect['yearly_pos'].to_numpy(),
+        category=PERFECT,
+        **exact_match_fields(perfect['mobile_match'].to_numpy(),
+                             perfect['addr_match'].to_numpy(),
+                             perfect['extra_match'].to_numpy())
+    )
+
+# Per-process state for the worker pool, set once by _init_worker
+_worker_state = {}
+
+def _init_worker(daily_cache, yearly_cache, columns):
+    _worker_state.update(daily_cache=daily_cache, yearly_cache=yearly_cache, columns=columns)
+
+def _score_shard(blocks):
+    state = _worker_state
+    stats = new_run_stats()
+    # One process per core already, so rapidfuzz runs single-threaded inside each
+    scored = score_blocks(blocks, state['daily_cache'], state['yearly_cache'], *state['columns'],
+                          scorer_workers=1, stats=stats)
+    return scored, stats
+
+def find_duplicates(df_daily, df_yearly, yearly_index, name_col, mobile_col, addr_col, extra_col, workers=1,
+                    stats=None, report=None, yearly_cache=None, multipass_index=None, compact=None):
+    """Match table (see matcher.MATCH_FIELDS) of the daily rows with a yearly match, in daily row order
+
+    compact (optional, consolidate.load_compact_yearly) limits blocking and
+    fuzzy scoring to the cluster representatives.
+    """
+    columns = (name_col, mobile_col, addr_col, extra_col)
+    with stage(report, 'column cache'):
+        daily_cache = build_column_cache(df_daily, *columns)
+        if yearly_cache is None:
+            yearly_cache = yearly_index.get('column_cache')
+        if yearly_cache is None:
+            yearly_cache = build_column_cache(df_yearly, *columns, normalized=yearly_index['normalized'])
+        block_index, block_cache = yearly_index, yearly_cache
+        if compact is not None:
+            block_index = compact['index']
+            block_cache = build_column_cache(compact['df'], *columns, normalized=block_index['normalized'])
+            multipass_index = None
+        if multipass_index is None:
+            multipass_index = block_index.get('multipass_index')
+    
+    # Exact re-entries are settled by a hash join, only the rest goes through blocking and fuzzy scoring
+    with stage(report, 'exact join'):
+        settled = settle_perfect_matches(daily_cache, yearly_cache, *columns, name_blocks=yearly_index['name'])
+    with stage(report, 'blocking'):
+        blocks = assign_blocks(df_daily, daily_cache, block_cache, block_index, *columns,
+                               skip=set(settled['daily_pos'].tolist()), multipass_index=multipass_index)
+    if report is not None:
+        record(report, 'daily_candidates', size_summary(_candidate_counts(blocks)))
+    
+    if workers is None or workers <= 0:
+        workers = os.cpu_count() or 1
+    shards = shard_blocks(blocks, workers)
+    
+    with stage(report, 'scoring'):
+        if workers == 1 or len(shards) <= 1:
+            shard_stats = new_run_stats()
+            scored = score_blocks(blocks, daily_cache, block_cache, *columns, stats=shard_stats)
+            scored_shards = [(scored, shard_stats)]
+        else:
+            with ProcessPoolExecutor(max_workers=len(shards), initializer=_init_worker,
+                                     initargs=(daily_cache, block_cache, columns)) as pool:
+                scored_shards = list(pool.map(_score_shard, shards))
+    if compact is not None:
+        for scored, _ in scored_shards:
+            scored['yearly_pos'] = compact['representatives'][scored['yearly_pos']].astype(np.int32)
+    
+    if stats is not None:
+        stats['exact_settled'] += len(settled['daily_pos'])
+        for _, shard_stats in scored_shards:
+            for name, count in shard_stats.items():
+                stats[name] += count
+    return concat_matches([settled] + [scored for scored, _ in scored_shards])
+
+def _candidate_counts(blocks):
+    """Number of candidates each blocked daily row is compared against"""
+    counts = []
+    for _, candidates, daily_positions in blocks:
+        counts.extend([len(candidates)] * len(daily_positions))
+    return counts
+
+def shard_label(source, source_id):
+    """Short name of a yearly source for the Yearly_Source column"""
+    location, tab = split_source(source)
+    if tab is not None:
+        return tab
+    if location.lower().endswith(('.csv', '.parquet')):
+        return os.path.basename(location)
+    return source_id
+
+def index_shard(source, df_yearly, source_id, name_col, mobile_col, addr_col, extra_col, consolidated=False):
+    """One yearly source as a shard: {'source', 'label', 'df', 'index', 'rows_added', 'compact', 'members'}
+
+    With consolidated=True and a usable saved consolidation (see
+    consolidate.py), 'compact' holds the cluster representatives that are
+    blocked and fuzzy-scored against and 'members' their clusters; otherwise
+    both are None and the whole sheet is matched.
+    """
+    columns = (name_col, mobile_col, addr_col, extra_col)
+    yearly_index, rows_added = load_or_build_yearly_index(df_yearly, source_id, *columns)
+    compact = load_compact_yearly(df_yearly, yearly_index, source_id, *columns) if consolidated else None
+    return {
+        'source': source,
+        'label': shard_label(source, source_id),
+        'df': df_yearly,
+        'index': yearly_index,
+        'rows_added': rows_added,
+        'compact': compact,
+        'members': compact['members'] if compact is not None else None
+    }
+
+def _match_shard(task):
+    df_daily, df_yearly, yearly_index, compact, columns, workers = task
+    stats = new_run_stats()
+    matches = find_duplicates(df_daily, df_yearly, yearly_index, *columns, workers=workers, stats=stats,
+                              compact=compact)
+    return matches, stats
+
+def merge_top_k(tables, top_k=1):
+    """Merge per-shard match tables (with a 'shard' field) into the best top_k matches per daily row
+
+    Matches are ranked by score, exact before fuzzy, then by category and
+    shard order. A 'rank' field (1 = best) is added.
+    """
+    table = concat_matches(tables)
+    order = np.lexsort((table['shard'], table['category'], ~table['is_exact'],
+                        -table['score'].astype(np.int64), table['daily_pos']))
+    table = take_matches(table, order)
+    
+    daily_pos = table['daily_pos']
+    starts = np.flatnonzero(np.r_[True, daily_pos[1:] != daily_pos[:-1]]) if len(daily_pos) else np.zeros(0, int)
+    rank = np.arange(len(daily_pos)) - np.repeat(starts, np.diff(np.r_[starts, len(daily_pos)]))
+    keep = rank < top_k
+    table = take_matches(table, keep)
+    table['rank'] = (rank[keep] + 1).astype(np.int16)
+    return table
+
+def find_duplicates_sharded(df_daily, shards, name_col, mobile_col, addr_col, extra_col, top_k=1, workers=1,
+                            stats=None, report=None):
+    """Match table of the best top_k matches per daily row over several yearly shards
+
+    Each shard (see index_shard) is searched with find_duplicates, in
+    parallel processes when workers > 1 and there are several shards. The
+    table gets a 'shard' field (position in shards) and a 'rank' field.
+    """
+    columns = (name_col, mobile_col, addr_col, extra_col)
+    if workers is None or workers <= 0:
+        workers = os.cpu_count() or 1
+    
+    with stage(report, 'shard search'):
+        if len(shards) == 1 or workers == 1:
+            # One shard keeps find_duplicates' own process pool and stage timings
+            results = []
+            for shard in shards:
+                shard_stats = new_run_stats()
+                matches = find_duplicates(df_daily, shard['df'], shard['index'], *columns, workers=workers,
+                                          stats=shard_stats, report=report, compact=shard.get('compact'))
+                results.append((matches, shard_stats))
+        else:
+            tasks = [(df_daily, shard['df'], shard['index'], shard.get('compact'), columns, 1) for shard in shards]
+            with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as pool:
+                results = list(pool.map(_match_shard, tasks))
+    
+    tables = []
+    for n, (matches, shard_stats) in enumerate(results):
+        matches['shard'] = np.full(len(matches['daily_pos']), n, dtype=np.int16)
+        tables.append(matches)
+        if stats is not None:
+            for name, count in shard_stats.items():
+                stats[name] += count
+    record(report, 'shards', [{'source': shard['label'], 'yearly_rows': len(shard['df']),
+                               'matches': len(matches['daily_pos'])}
+                              for shard, (matches, _) in zip(shards, results)])
+    with stage(report, 'merge shards'):
+        return merge_top_k(tables, top_k)
+
+def build_sharded_results(df_daily, shards, matches, name_col, mobile_col, addr_col, extra_col, top_k=1):
+    """build_results for a find_duplicates_sharded table
+
+    With several shards a Yearly_Source column names the shard of each
+    match, and with top_k > 1 a Rank column orders the matches of a daily row.
+    """
+    columns = (name_col, mobile_col, addr_col, extra_col)
+    frames = []
+    rows_per_frame = []
+    for n, shard in enumerate(shards):
+        rows = np.flatnonzero(matches['shard'] == n)
+        if len(rows):
+            frames.append(build_results(df_daily, shard['df'], take_matches(matches, rows), *columns)[0])
+            rows_per_frame.append(rows)
+    if not frames:
+        return pd.DataFrame(), pd.DataFrame(), set()
+    
+    # Back to the merged order (daily row, then rank)
+    order = np.argsort(np.concatenate(rows_per_frame), kind='stable')
+    df_all_duplicates = pd.concat(frames, ignore_index=True).iloc[order].reset_index(drop=True)
+    position = 3  # after Daily_Rec, Match_Type, Score
+    if top_k > 1:
+        df_all_duplicates.insert(position, 'Rank', matches['rank'].astype(np.int64))
+        position += 1
+    if len(shards) > 1:
+        labels = np.asarray([shard['label'] for shard in shards], dtype=object)
+        df_all_duplicates.insert(position, 'Yearly_Source', labels[matches['shard']])
+        position += 1
+    if any(shard.get('members') is not None for shard in shards):
+        # Every yearly row behind a consolidated match, not just its representative
+        linked = np.empty(len(matches['daily_pos']), dtype=object)
+        for n, shard in enumerate(shards):
+            rows = np.flatnonzero(matches['shard'] == n)
+            if shard.get('members') is not None:
+                linked[rows] = linked_records(shard['members'], matches['yearly_pos'][rows])
+            else:
+                linked[rows] = (matches['yearly_pos'][rows] + 1).astype(str)
+        df_all_duplicates.insert(position, 'Yearly_Linked_Recs', linked)
+    
+    perfect = matches['category'] == PERFECT
+    df_perfect_only = df_all_duplicates[perfect].reset_index(drop=True)
+    if df_perfect_only.empty:
+        df_perfect_only = pd.DataFrame()
+    return df_all_duplicates, df_perfect_only, set(matches['daily_pos'][perfect].tolist())
+
+def find_within_day_duplicates(df_daily, name_col, mobile_col, addr_col, extra_col, stats=None, report=None):
+    """Match table of duplicate pairs inside the daily sheet (a blocked self-join)
+
+    Rows are paired within the usual blocks (utils.self_join_pairs): each
+    unordered pair once, never a row with itself, and big blocks only
+    within a window, so the work stays linear. Pairs that only agree on the
+    name are dropped (config.WITHIN_DAY_MIN_FIELD_PCT). daily_pos is the
+    earlier row of a pair and yearly_pos the later one.
+    """
+    columns = (name_col, mobile_col, addr_col, extra_col)
+    with stage(report, 'within-day index'):
+        daily_index = _index_rows(df_daily, None, *columns)
+        daily_cache = build_column_cache(df_daily, *columns, normalized=daily_index['normalized'])
+        pairs = self_join_pairs(self_join_indexes(daily_index, daily_cache, name_col), len(df_daily))
+    record(report, 'within_day_pairs', len(pairs))
+    with stage(report, 'within-day scoring'):
+        matches = score_pairs(daily_cache, pairs, *columns, min_score=config.WITHIN_DAY_MIN_SCORE,
+                              min_exact_cols=config.WITHIN_DAY_MIN_EXACT_COLUMNS, stats=stats)
+    min_pct = config.WITHIN_DAY_MIN_FIELD_PCT
+    other_field = matches['col2_match'] | (matches['col3_pct'] >= min_pct) | (matches['col4_pct'] >= min_pct)
+    return take_matches(matches, other_field)
+
+def build_within_day_results(df_daily, matches, name_col, mobile_col, addr_col, extra_col):
+    """'Within-Day Duplicates' frame: build_results with the later row of each pair as Other_*"""
+    df_within_day, _, _ = build_results(df_daily, df_daily, matches, name_col, mobile_col, addr_col, extra_col)
+    if df_within_day.empty:
+        return df_within_day
+    df_within_day.columns = ['Other_' + col[len('Yearly_'):] if col.startswith('Yearly_') else col
+                             for col in df_within_day.columns]
+    df_within_day.insert(1, 'Other_Rec', matches['yearly_pos'].astype(np.int64) + 1)
+    return df_within_day
+
+# Extra context columns copied into every result row (blank when the sheet lacks them)
+CONTEXT_COLUMNS = ['Patient Address', 'Facility Name Lform', 'Date Of Onset']
+
+def clean_column(series, max_length=None):
+    """Column with NaN and 'NA'/'nan' text blanked, optionally cut to max_length characters"""
+    values = series.astype(object).reset_index(drop=True)
+    blank = values.isna() | values.isin(['NA', 'nan', ''])
+    values = values.where(~blank, '')
+    if max_length is not None:
+        values = values.astype(str).str[:max_length]
+    return values
+
+def _pct_marks(pct):
+    """'✅ 87%' / '❌ 42%' labels for fuzzy column percentages"""
+    marks = pd.Series(np.where(pct >= 80, '✅', '❌'), dtype=object)
+    return marks + ' ' + pd.Series(pct.astype(np.int64)).astype(str) + '%'
+
+def _match_marks(match):
+    return pd.Series(np.where(match, '✅', '❌'), dtype=object)
+
+def build_results(df_daily, df_yearly, matches, name_col, mobile_col, addr_col, extra_col, record_numbers=None):
+    """Possible/perfect duplicate frames and the daily positions of perfect duplicates
+
+    matches is a match table from find_duplicates. Only the matched rows of
+    each column are taken from the sheets, and every column is built in one
+    vectorized pass. record_numbers (optional) gives the Daily_Rec of each
+    daily row when df_daily is a subset of the sheet (default: position + 1).
+    """
+    n = len(matches['daily_pos'])
+    if n == 0:
+        return pd.DataFrame(), pd.DataFrame(), set()
+    daily_pos = matches['daily_pos']
+    yearly_pos = matches['yearly_pos']
+    is_exact = matches['is_exact']
+    
+    if record_numbers is None:
+        daily_rec = daily_pos.astype(np.int64) + 1
+    else:
+        daily_rec = np.asarray(record_numbers, dtype=np.int64)[daily_pos]
+    result = {
+        'Daily_Rec': daily_rec,
+        'Match_Type': np.asarray(MATCH_TYPES, dtype=object)[matches['category']],
+        'Score': matches['score'].astype(np.int64)
+    }
+    
+    def add_pair(key, col, max_length=None):
+        result[f"Daily_{key}"] = clean_column(df_daily[col].take(daily_pos), max_length)
+        result[f"Yearly_{key}"] = clean_column(df_yearly[col].take(yearly_pos), max_length)
+    
+    # Add columns only if selected; exact matches get plain ticks, fuzzy ones percentages
+    if name_col != 'None':
+        add_pair('Col1', name_col)
+        result['Col1'] = _pct_marks(matches['col1_pct']).where(~is_exact, '✅')
+    if mobile_col != 'None':
+        add_pair('Col2', mobile_col)
+        result['Col2'] = _match_marks(matches['col2_match'])
+    if addr_col != 'None':
+        add_pair('Col3', addr_col, max_length=50)
+        result['Col3'] = _pct_marks(matches['col3_pct']).where(~is_exact, _match_marks(matches['col3_match']))
+    if extra_col != 'None':
+        add_pair('Col4', extra_col, max_length=50)
+        result['Col4'] = _pct_marks(matches['col4_pct']).where(~is_exact, _match_marks(matches['col4_match']))
+    
+    for col in CONTEXT_COLUMNS:
+        for side, df, positions in [('Daily', df_daily, daily_pos), ('Yearly', df_yearly, yearly_pos)]:
+            if col in df.columns:
+                result[f"{side}_{col}"] = clean_column(df[col].take(positions))
+            else:
+                result[f"{side}_{col}"] = pd.Series([''] * n, dtype=object)
+    
+    df_all_duplicates = pd.DataFrame({key: np.asarray(values) for key, values in result.items()})
+    perfect = matches['category'] == PERFECT
+    df_perfect_only = df_all_duplicates[perfect].reset_index(drop=True)
+    if df_perfect_only.empty:
+        df_perfect_only = pd.DataFrame()
+    perfect_duplicate_ids = set(daily_pos[perfect].tolist())
+    return df_all_duplicates, df_perfect_only, perfect_duplicate_ids
+
+def update_sheets(daily_spreadsheet, daily_worksheet, df_all_duplicates, df_perfect_only, perfect_duplicate_ids,
+                  notify=None, report=None, df_within_day=None):
+    """Write the result tabs and delete perfect duplicates from the daily sheet
+
+    The tabs (plus 'Within-Day Duplicates' when df_within_day is given) are
+    written in parallel; rows are only deleted once all writes succeeded.
+    notify(message, done) is called for progress messages (done=True on
+    success), always from the calling thread.
+    """
+    from google_sheets import create_or_clear_sheet, write_df_to_sheet, delete_rows_by_indices
+    notify = notify or (lambda message, done=False: print(message))
+    
+    def write_tab(sheet_name, df):
+        with stage(report, f"write '{sheet_name}'"):
+            worksheet = create_or_clear_sheet(daily_spreadsheet, sheet_name, rows=len(df) + 1, cols=len(df.columns))
+            write_df_to_sheet(worksheet, df)
+    
+    tabs = [(name, df) for name, df in [("Possible Duplicates", df_all_duplicates),
+                                         ("Perfect Duplicates", df_perfect_only),
+                                         ("Within-Day Duplicates", df_within_day)] if df is not None and not df.empty]
+    notify("Steps 1-2: Creating " + " and ".join(f"'{name}'" for name, _ in tabs) + " tabs...", False)
+    run_concurrently([lambda name=name, df=df: write_tab(name, df) for name, df in tabs])
+    for name, df in tabs:
+        notify(f"✅ Created '{name}' with {len(df)} rows", True)
+    
+    notify("Step 3: Deleting perfect duplicates from Daily sheet...", False)
+    if perfect_duplicate_ids:
+        with stage(report, 'delete perfect duplicates'):
+            delete_rows_by_indices(daily_worksheet, list(perfect_duplicate_ids))
+        notify(f"✅ Deleted {len(perfect_duplicate_ids)} perfect duplicates from Daily sheet", True)
+
+def run(yearly_source, daily_source, name_col='None', mobile_col='None', addr_col='None', extra_col='None',
+        workers=None, credentials=None, output_dir=None, write_sheets=False, report_path=None, top_k=1,
+        consolidated=False, within_day=False):
+    """Headless duplicate run: load the sources, match, and write the results
+
+    yearly_source is one source or a list of them (one shard each, see
+    find_duplicates_sharded); top_k matches are kept per daily row. With
+    consolidated=True each source is matched by its consolidated golden
+    records (consolidate.py) where available. within_day=True also reports
+    duplicates inside the daily sheet (find_within_day_duplicates).
+    """
+    yearly_sources = [yearly_source] if isinstance(yearly_source, str) else list(yearly_source)
+    columns = (name_col, mobile_col, addr_col, extra_col)
+    report = new_report() if report_path else None
+    client = None
+    if credentials:
+        from google_sheets import authenticate_google_sheets
+        with stage(report, 'authenticate'):
+            client = authenticate_google_sheets(credentials)
+    
+    def read(name, source):
+        with stage(report, f"read {name}"):
+            return load_frame(source, client)
+    
+    names = ['yearly'] if len(yearly_sources) == 1 else [f"yearly {source}" for source in yearly_sources]
+    frames = run_concurrently([lambda: read('daily', daily_source)] +
+                              [lambda name=name, source=source: read(name, source)
+                               for name, source in zip(names, yearly_sources)])
+    df_daily, _ = frames[0]
+    print(f"Loaded {sum(len(df) for df, _ in frames[1:])} yearly ({len(yearly_sources)} sources), {len(df_daily)} daily")
+    
+    with stage(report, 'yearly index'):
+        shards = [index_shard(source, df_yearly, yearly_id, *columns, consolidated=consolidated)
+                  for source, (df_yearly, yearly_id) in zip(yearly_sources, frames[1:])]
+    print(f"Yearly index ready ({sum(shard['rows_added'] for shard in shards)} new rows indexed)")
+    for shard, (df_yearly, _) in zip(shards, frames[1:]):
+        if shard['members'] is not None:
+            print(f"{shard['label']}: matching {len(shard['compact']['df'])} golden records "
+                  f"for {len(df_yearly)} yearly rows")
+        elif consolidated:
+            print(f"{shard['label']}: no up-to-date consolidation, matching all yearly rows "
+                  f"(run consolidate.py to build one)")
+    if len(shards) == 1:
+        record_block_stats(report, shards[0]['index'])
+    
+    stats = new_run_stats()
+    matches = find_duplicates_sharded(df_daily, shards, *columns, top_k=top_k, workers=workers,
+                                      stats=stats, report=report)
+    print("Work: " + ", ".join(f"{name}={count}" for name, count in stats.items()))
+    record_match_stats(report, matches, stats, len(df_daily))
+    with stage(report, 'build results'):
+        df_all_duplicates, df_perfect_only, perfect_duplicate_ids = build_sharded_results(
+            df_daily, shards, matches, *columns, top_k=top_k
+        )
+    print(f"Found {len(perfect_duplicate_ids)} PERFECT duplicates | {len(df_all_duplicates)} total matches")
+    
+    df_within_day = None
+    if within_day:
+        within_day_matches = find_within_day_duplicates(df_daily, *columns, report=report)
+        with stage(report, 'build within-day results'):
+            df_within_day = build_within_day_results(df_daily, within_day_matches, *columns)
+        print(f"Found {len(df_within_day)} duplicate pairs within the daily sheet")
+    
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        df_all_duplicates.to_csv(os.path.join(output_dir, 'possible_duplicates.csv'), index=False)
+        df_perfect_only.to_csv(os.path.join(output_dir, 'perfect_duplicates.csv'), index=False)
+        if df_within_day is not None:
+            df_within_day.to_csv(os.path.join(output_dir, 'within_day_duplicates.csv'), index=False)
+    
+    if write_sheets:
+        from google_sheets import get_sheet_by_url
+        daily_spreadsheet = get_sheet_by_url(client, split_source(daily_source)[0])
+        update_sheets(daily_spreadsheet, daily_spreadsheet.sheet1, df_all_duplicates, df_perfect_only,
+                      perfect_duplicate_ids, report=report, df_within_day=df_within_day)
+    
+    if report_path:
+        write_report(report, report_path)
+        print(f"Run report written to {report_path}")
+    
+    return df_all_duplicates, df_perfect_only, perfect_duplicate_ids
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find patient duplicates between a yearly and a daily sheet")
+    parser.add_argument('--yearly', required=True, action='append',
+                        help="Yearly sheet URL (optionally 'URL::Tab name') or local .csv/.parquet file; "
+                             "repeat to match against several yearly sources")
+    parser.add_argument('--daily', required=True, help="Daily sheet URL or local .csv/.parquet file")
+    parser.add_argument('--name-col', default='None', help="Column 1 (Name)")
+    parser.add_argument('--mobile-col', default='None', help="Column 2 (Mobile)")
+    parser.add_argument('--addr-col', default='None', help="Column 3 (Address)")
+    parser.add_argument('--extra-col', default='None', help="Column 4 (Extra)")
+    parser.add_argument('--workers', type=int, default=0, help="Worker processes (0 = all cores)")
+    parser.add_argument('--credentials', help="Service account JSON (needed for sheet URLs)")
+    parser.add_argument('--output-dir', help="Write result CSVs to this folder")
+    parser.add_argument('--write-sheets', action='store_true',
+                        help="Write result tabs and delete perfect duplicates in the daily sheet")
+    parser.add_argument('--report', help="Write a JSON run report (stage timings, block sizes) to this file")
+    parser.add_argument('--top-k', type=int, default=1, help="Matches to keep per daily row (across all sources)")
+    parser.add_argument('--consolidated', action='store_true',
+                        help="Match against the golden records built by consolidate.py")
+    parser.add_argument('--within-day', action='store_true',
+                        help="Also report duplicates inside the daily sheet ('Within-Day Duplicates')")
+    parser.add_argument('--watch', type=float, metavar='SECONDS',
+                        help="Keep polling the daily sheet and only match new or edited rows (writes the sheet)")
+    parser.add_argument('--polls', type=int, help="With --watch: stop after this many polls")
+    args = parser.parse_args(argv)
+    
+    if all(col == 'None' for col in [args.name_col, args.mobile_col, args.addr_col, args.extra_col]):
+        parser.error("select at least 1 column to compare")
+    if args.write_sheets and not args.credentials:
+        parser.error("--write-sheets needs --credentials")
+    if args.watch is not None and not args.credentials:
+        parser.error("--watch needs --credentials")
+    if args.watch is not None and len(args.yearly) > 1:
+        parser.error("--watch takes a single --yearly source")
+    if args.top_k < 1:
+        parser.error("--top-k must be at least 1")
+    
+    if args.watch is not None:
+        from watch import watch
+        try:
+            watch(args.yearly[0], args.daily, args.name_col, args.mobile_col, args.addr_col, args.extra_col,
+                  credentials=args.credentials, interval=args.watch, max_polls=args.polls)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    
+    run(args.yearly, args.daily, args.name_col, args.mobile_col, args.addr_col, args.extra_col,
+        workers=args.workers, credentials=args.credentials, output_dir=args.output_dir,
+        write_sheets=args.write_sheets, report_path=args.report, top_k=args.top_k,
+        consolidated=args.consolidated, within_day=args.within_day)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Startup benchmark: boot time and time to first result of a fresh process, cold and warm
+
+Each measurement runs in a new interpreter, like a freshly started replica:
+'boot' is what app.py loads before it renders (Streamlit and config, when
+Streamlit is installed), 'first result' a full comparison of a synthetic
+daily sheet against a yearly sheet whose index is already on disk. The warm
+run first lets warmup.warm_start() finish, as a replica would while idle.
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+COLUMNS = ('Patient Name', 'Mobile Number', 'Patient Address', 'Age')
+
+def _prepare(workdir, yearly_rows, daily_rows):
+    """Write the synthetic sheets and build the yearly index (the 'most recently used' one)"""
+    import config
+    config.INDEX_CACHE_DIR = os.path.join(workdir, 'index')
+    from benchmark import generate_patients, generate_daily
+    from pipeline import load_frame, index_shard
+    df_yearly = generate_patients(yearly_rows)
+    df_yearly.to_csv(os.path.join(workdir, 'yearly.csv'), index=False)
+    generate_daily(df_yearly, daily_rows).to_csv(os.path.join(workdir, 'daily.csv'), index=False)
+    df_yearly, yearly_id = load_frame(os.path.join(workdir, 'yearly.csv'))
+    index_shard('yearly.csv', df_yearly, yearly_id, *COLUMNS)
+    return {}
+
+def _measure_process(workdir, warm):
+    """Boot, (optionally) warm up, then time the first comparison; runs in a fresh interpreter"""
+    started = time.perf_counter()
+    import config
+    config.INDEX_CACHE_DIR = os.path.join(workdir, 'index')
+    try:
+        importlib.import_module('streamlit')
+    except ImportError:
+        pass
+    result = {'mode': 'warm' if warm else 'cold', 'boot_seconds': time.perf_counter() - started}
+
+    if warm:
+        from warmup import warm_start, warm_status
+        warm_start().join()
+        status = warm_status()
+        result['warm_seconds'] = status['seconds']
+        result['warm_state'] = status['state']
+
+    first = time.perf_counter()
+    from pipeline import load_frame, index_shard, find_duplicates_sharded, build_sharded_results
+    df_yearly, yearly_id = load_frame(os.path.join(workdir, 'yearly.csv'))
+    df_daily, _ = load_frame(os.path.join(workdir, 'daily.csv'))
+    shards = [index_shard('yearly.csv', df_yearly, yearly_id, *COLUMNS)]
+    matches = find_duplicates_sharded(df_daily, shards, *COLUMNS, workers=1)
+    df_all_duplicates, _, _ = build_sharded_results(df_daily, shards, matches, *COLUMNS)
+    result['first_result_seconds'] = time.perf_counter() - first
+    result['matches'] = len(df_all_duplicates)
+    return result
+
+def _child(step, workdir, *args):
+    """Run one step in a new interpreter; returns its JSON result and the process wall time"""
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--step', step, '--workdir', workdir,
+                             *[str(arg) for arg in args]],
+                            check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result['process_seconds'] = time.perf_counter() - started
+    return result
+
+def run_startup_benchmark(yearly_rows, daily_rows, repeats=1):
+    with tempfile.TemporaryDirectory() as workdir:
+        _child('prepare', workdir, '--yearly-rows', yearly_rows, '--daily-rows', daily_rows)
+        results = []
+        for _ in range(repeats):
+            for step in ['cold', 'warm']:
+                entry = {key: round(value, 4) if isinstance(value, float) else value
+                         for key, value in _child(step, workdir).items()}
+                entry.update({'yearly_rows': yearly_rows, 'daily_rows': daily_rows})
+                results.append(entry)
+                print(json.dumps(entry))
+        return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Startup and time-to-first-result benchmark (cold vs warm start)")
+    parser.add_argument('--yearly-rows', type=int, default=100000)
+    parser.add_argument('--daily-rows', type=int, default=2000)
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--output', default='startup_results.json')
+    parser.add_argument('--step', choices=['prepare', 'cold', 'warm'], help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.step:
+        if args.step == 'prepare':
+            result = _prepare(args.workdir, args.yearly_rows, args.daily_rows)
+        else:
+            result = _measure_process(args.workdir, warm=args.step == 'warm')
+        print(json.dumps(result))
+        return 0
+
+    results = run_startup_benchmark(args.yearly_rows, args.daily_rows, args.repeats)
+    with open(args.output, 'w') as f:
+        json.dump({'meta': {'timestamp': datetime.now().isoformat(timespec='seconds'),
+                            'python': sys.version.split()[0], 'cpu_count': os.cpu_count()},
+                   'results': results}, f, indent=2)
+    print(f"Wrote {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import pytest
+from gspread.exceptions import APIError
+from fake_sheets import FakeSpreadsheet, FakeWorksheet
+from google_sheets import delete_rows_by_indices, call_with_retry, contiguous_ranges, read_sheet_to_df
+import config
+
+HEADER = ['Name', 'Mobile']
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(config, 'API_BACKOFF_SECONDS', 0)
+
+def make_sheet(n_rows):
+    spreadsheet = FakeSpreadsheet()
+    rows = [[f"patient {i}", f"98765{i:05d}"] for i in range(n_rows)]
+    return spreadsheet, FakeWorksheet.from_records(spreadsheet, 'Daily', HEADER, rows)
+
+def names(worksheet):
+    return [row[0] for row in worksheet.get_all_values()[1:]]
+
+def test_contiguous_ranges_merges_unsorted_duplicates():
+    assert contiguous_ranges([5, 1, 2, 2, 8, 6]) == [(1, 3), (5, 7), (8, 9)]
+
+def test_delete_rows_unsorted_and_duplicate_indices():
+    spreadsheet, worksheet = make_sheet(10)
+    delete_rows_by_indices(worksheet, [7, 0, 3, 7, 4, 9, 0])
+    assert worksheet.get_all_values()[0] == HEADER
+    assert names(worksheet) == [f"patient {i}" for i in [1, 2, 5, 6, 8]]
+    assert spreadsheet.calls['batch_update'] == 1
+
+@pytest.mark.parametrize('batch_size, calls', [(1, 4), (3, 2), (4, 1), (500, 1)])
+def test_delete_rows_batch_update_calls(batch_size, calls):
+    spreadsheet, worksheet = make_sheet(20)
+    # Four separate ranges: 1, 4-5, 10, 15-17
+    delete_rows_by_indices(worksheet, [16, 1, 4, 10, 5, 15, 17], batch_size=batch_size)
+    assert spreadsheet.calls['batch_update'] == calls
+    assert names(worksheet) == [f"patient {i}" for i in [0, 2, 3, 6, 7, 8, 9, 11, 12, 13, 14, 18, 19]]
+
+def test_delete_rows_nothing_to_delete():
+    spreadsheet, worksheet = make_sheet(3)
+    delete_rows_by_indices(worksheet, [])
+    assert spreadsheet.calls['batch_update'] == 0
+    assert len(names(worksheet)) == 3
+
+def test_delete_rows_retried_after_429():
+    spreadsheet, worksheet = make_sheet(5)
+    spreadsheet.fail_next(2, 429)
+    delete_rows_by_indices(worksheet, [1, 3])
+    assert spreadsheet.calls['batch_update'] == 3
+    assert names(worksheet) == ["patient 0", "patient 2", "patient 4"]
+
+def test_delete_rows_not_retried_on_500():
+    spreadsheet, worksheet = make_sheet(5)
+    spreadsheet.fail_next(1, 500)
+    with pytest.raises(APIError):
+        delete_rows_by_indices(worksheet, [1, 3])
+    assert spreadsheet.calls['batch_update'] == 1
+    assert len(names(worksheet)) == 5
+
+def test_call_with_retry_gives_up_after_retries():
+    spreadsheet, worksheet = make_sheet(1)
+    spreadsheet.fail_next(3, 429)
+    with pytest.raises(APIError):
+        call_with_retry(worksheet.get_all_values, retries=2)
+    assert spreadsheet.calls['get_all_values'] == 3
+
+def test_call_with_retry_custom_statuses():
+    spreadsheet, worksheet = make_sheet(1)
+    spreadsheet.fail_next(1, 503)
+    assert call_with_retry(worksheet.get_all_values, statuses={503})[0] == HEADER
+    assert spreadsheet.calls['get_all_values'] == 2
+
+def test_read_sheet_in_chunks():
+    spreadsheet = FakeSpreadsheet()
+    rows = [[f"patient {i}", f"98765{i:05d}", "Pune" if i % 2 else "Nagpur"] for i in range(50)]
+    rows[7] = []
+    rows[20] = rows[20][:1]
+    worksheet = FakeWorksheet.from_records(spreadsheet, 'Daily', HEADER + ['City'], rows + [[], []])
+    df = read_sheet_to_df(worksheet, chunk_rows=8)
+    assert len(df) == 50
+    assert df['Name'].tolist()[:3] == ["patient 0", "patient 1", "patient 2"]
+    assert df.iloc[7].tolist() == ['', '', '']
+    assert df.iloc[20].tolist() == ["patient 20", '', '']
+    assert df['Name'].dtype == object
+    assert str(df['City'].dtype) == 'category'
+    assert sorted(df['City'].cat.categories) == ['', 'Nagpur', 'Pune']
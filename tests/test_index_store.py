@@ -0,0 +1,29 @@
+import pandas as pd
+from index_store import load_or_build_yearly_index
+
+COLUMNS = ('Name', 'Mobile', 'None', 'None')
+
+def yearly_frame(n_rows):
+    return pd.DataFrame({'Name': [f"patient {i}" for i in range(n_rows)],
+                         'Mobile': [f"98765{i:05d}" for i in range(n_rows)]})
+
+def test_appended_rows_are_indexed_incrementally(tmp_path):
+    df = yearly_frame(10)
+    load_or_build_yearly_index(df.iloc[:8], 'yearly', *COLUMNS, cache_dir=str(tmp_path))
+    index, rows_added = load_or_build_yearly_index(df, 'yearly', *COLUMNS, cache_dir=str(tmp_path))
+    assert rows_added == 2
+    assert index['normalized']['Name'].tolist() == df['Name'].tolist()
+
+def test_edited_earlier_row_rebuilds_the_index(tmp_path):
+    df = yearly_frame(10)
+    load_or_build_yearly_index(df, 'yearly', *COLUMNS, cache_dir=str(tmp_path))
+    df.loc[5, 'Name'] = 'completely different'
+    index, rows_added = load_or_build_yearly_index(df, 'yearly', *COLUMNS, cache_dir=str(tmp_path))
+    assert rows_added == 10
+    assert index['normalized']['Name'][5] == 'completely different'
+
+def test_unchanged_sheet_reuses_the_index(tmp_path):
+    df = yearly_frame(10)
+    load_or_build_yearly_index(df, 'yearly', *COLUMNS, cache_dir=str(tmp_path))
+    _, rows_added = load_or_build_yearly_index(df.copy(), 'yearly', *COLUMNS, cache_dir=str(tmp_path))
+    assert rows_added == 0
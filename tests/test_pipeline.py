@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+from index_store import load_or_build_yearly_index
+from pipeline import find_duplicates, build_results
+import config
+
+COLUMNS = ('Name', 'Mobile', 'Address', 'Age')
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'INDEX_CACHE_DIR', str(tmp_path))
+
+def match(df_daily, df_yearly):
+    yearly_index, _ = load_or_build_yearly_index(df_yearly, 'yearly', *COLUMNS)
+    matches = find_duplicates(df_daily, df_yearly, yearly_index, *COLUMNS, workers=1)
+    df_all, _, _ = build_results(df_daily, df_yearly, matches, *COLUMNS)
+    return df_all
+
+def test_new_mobile_number_falls_back_to_the_name_block():
+    df_yearly = pd.DataFrame({'Name': ['Asha Patil', 'Ravi Kumar'], 'Mobile': ['9876543210', '9123400000'],
+                              'Address': ['12, MG Road, Pune', '4, Station Road, Nagpur'], 'Age': ['34', '51']})
+    df_daily = pd.DataFrame({'Name': ['Asha Patil'], 'Mobile': ['9000011111'],
+                             'Address': ['12, MG Road, Pune'], 'Age': ['34']})
+    df_all = match(df_daily, df_yearly)
+    assert df_all['Match_Type'].tolist() == ['🟢 STRONG']
@@ -0,0 +1,74 @@
+import pytest
+from gspread.exceptions import APIError
+from benchmark import generate_patients, generate_daily
+from fake_sheets import FakeSpreadsheet, FakeWorksheet, FakeResponse
+from google_sheets import SheetFrameCache
+from index_store import load_or_build_yearly_index
+import config
+import watch
+
+COLUMNS = ('Patient Name', 'Mobile Number', 'Patient Address', 'Age')
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'INDEX_CACHE_DIR', str(tmp_path))
+    df_yearly = generate_patients(2000, seed=1).astype(str)
+    df_daily = generate_daily(df_yearly, 200, seed=2).astype(str)
+    yearly_index, _ = load_or_build_yearly_index(df_yearly, 'yearly', *COLUMNS)
+    yearly = watch.prepare_yearly(df_yearly, yearly_index, *COLUMNS)
+    spreadsheet = FakeSpreadsheet()
+    FakeWorksheet.from_records(spreadsheet, 'Daily', list(df_daily.columns), df_daily.iloc[:100].values.tolist())
+    state = watch.new_watch_state()
+    cache = SheetFrameCache(max_entries=1)
+
+    def poll():
+        return watch.watch_cycle(state, spreadsheet, df_yearly, yearly, COLUMNS, cache, notify=lambda *a, **k: None)
+
+    poll()
+    spreadsheet.sheet1.append_rows(df_daily.iloc[100:].values.tolist())
+    return spreadsheet, state, poll
+
+def fail_appends(spreadsheet, titles):
+    """Make the next append to each tab in titles fail with a 503, without touching the sheet"""
+    for title in titles:
+        worksheet = spreadsheet.worksheet(title)
+        append_rows = worksheet.append_rows
+
+        def failing(values, *args, append_rows=append_rows, worksheet=worksheet, **kwargs):
+            worksheet.append_rows = append_rows
+            raise APIError(FakeResponse(503, "fake error on append_rows"))
+        worksheet.append_rows = failing
+
+def tab_rows(spreadsheet, title):
+    return spreadsheet.worksheet(title).get_all_values()[1:]
+
+def test_failed_append_is_retried_on_unchanged_sheet(setup):
+    spreadsheet, state, poll = setup
+    before = {title: len(tab_rows(spreadsheet, title)) for title in watch.RESULT_TABS}
+    daily_rows = len(spreadsheet.sheet1.get_all_values())
+    fail_appends(spreadsheet, watch.RESULT_TABS)
+    with pytest.raises(APIError):
+        poll()
+    assert len(spreadsheet.sheet1.get_all_values()) == daily_rows
+
+    summary = poll()
+    assert summary is not None and summary['perfect_deleted'] > 0
+    assert len(spreadsheet.sheet1.get_all_values()) == daily_rows - summary['perfect_deleted']
+    for title in watch.RESULT_TABS:
+        assert len(tab_rows(spreadsheet, title)) > before[title]
+    assert not state['unwritten'] and not len(state['pending_positions'])
+
+def test_partial_append_only_retries_the_failed_tab(setup):
+    spreadsheet, state, poll = setup
+    fail_appends(spreadsheet, ["Perfect Duplicates"])
+    with pytest.raises(APIError):
+        poll()
+    possible = tab_rows(spreadsheet, "Possible Duplicates")
+    assert list(state['unwritten']) == ["Perfect Duplicates"]
+
+    poll()
+    assert tab_rows(spreadsheet, "Possible Duplicates") == possible
+    perfect = tab_rows(spreadsheet, "Perfect Duplicates")
+    assert len(perfect) == len({tuple(row) for row in perfect})
+    assert poll() is not None  # re-reads the sheet after its own deletions
+    assert poll() is None
@@ -1,5 +1,11 @@
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 import re
+from rapidfuzz.utils import default_process
+import config
 
 def convert_to_csv_url(url):
     """Convert Google Sheet URL to CSV export URL"""
@@ -8,42 +14,383 @@ def convert_to_csv_url(url):
         return f"https://docs.google.com/spreadsheets/d/{sheet_id.group(1)}/export?format=csv"
     return url
 
+def run_concurrently(tasks, max_workers=None):
+    """Run zero-argument callables on a thread pool; results come back in task order
+
+    Once all tasks finished, the exception of the first failing task is re-raised.
+    """
+    if len(tasks) <= 1:
+        return [task() for task in tasks]
+    max_workers = max_workers or config.IO_MAX_WORKERS
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tasks))) as pool:
+        futures = [pool.submit(task) for task in tasks]
+    return [future.result() for future in futures]
+
 def normalize(text):
     """Normalize text for comparison"""
     if pd.isna(text):
         return ""
     return str(text).lower().strip()
 
-def get_block_key(mobile):
-    """Get blocking key from mobile number (last 4 digits)"""
-    if mobile is None:
-        return "XXXX"
-    m = str(mobile).strip()[-4:] if mobile else "XXXX"
-    return m
+def normalize_series(series):
+    """Normalize a whole column at once (same rules as normalize)"""
+    values = series.astype(object)
+    text = values.where(values.notna(), "").astype(str)
+    return text.str.lower().str.strip()
+
+def build_column_cache(df, name_col, mobile_col, addr_col, extra_col, normalized=None):
+    """Normalized forms ('norm', 'processed', 'sorted', 'canonical') of the selected columns, built once per run
+
+    normalized (optional) is a frame of already normalized columns, e.g.
+    from the yearly index store.
+    """
+    cache = {}
+    for col in [name_col, mobile_col, addr_col, extra_col]:
+        if col == 'None' or col is None or col in cache:
+            continue
+        if normalized is not None:
+            values = normalized[col]
+        else:
+            values = normalize_series(df[col])
+        codes, uniques = pd.factorize(values)
+        uniques = [sys.intern(str(value)) for value in uniques]
+        
+        def expand(forms):
+            return np.asarray(forms, dtype=object)[codes].tolist() if len(codes) else []
+        
+        cache[col] = {
+            'norm': expand(uniques),
+            'processed': expand([default_process(value) for value in uniques])
+        }
+        if col == name_col:
+            cache[col]['sorted'] = expand([" ".join(sorted(value.split())) for value in uniques])
+        if col == mobile_col:
+            cache[col]['canonical'] = expand([sys.intern(canonical_mobile(value) or value) for value in uniques])
+    return cache
+
+_SCIENTIFIC = re.compile(r'^\d(\.\d+)?[eE]\+?\d+$')
+_COUNTRY_CODE = re.compile(r'^91(?=\d{10}$)')
+
+def canonical_mobile(mobile):
+    """Canonical mobile number: digits only, no +91 / leading 0, no float '.0'
+
+    Returns "" when there are no digits (blank, None, NaN).
+    """
+    if mobile is None or pd.isna(mobile):
+        return ""
+    text = str(mobile).strip()
+    if _SCIENTIFIC.match(text):
+        text = str(int(float(text)))
+    text = re.sub(r'\.0+$', '', text)
+    digits = re.sub(r'\D', '', text).lstrip('0')
+    return _COUNTRY_CODE.sub('', digits)
+
+def canonical_mobile_series(series):
+    """Canonical numbers for a whole mobile column (same rules as canonical_mobile)"""
+    values = series.astype(object)
+    text = values.where(values.notna(), "").astype(str).str.strip()
+    scientific = text.str.match(_SCIENTIFIC)
+    if scientific.any():
+        text = text.where(~scientific, text[scientific].map(lambda value: str(int(float(value)))))
+    text = text.str.replace(r'\.0+$', '', regex=True)
+    digits = text.str.replace(r'\D', '', regex=True).str.lstrip('0')
+    return digits.str.replace(_COUNTRY_CODE, '', regex=True)
+
+def mobile_suffix_keys(canonical):
+    """Last MOBILE_SUFFIX_DIGITS digits of canonical numbers, for the typo fallback
+
+    Returns (keys, valid); numbers shorter than the suffix are not valid.
+    """
+    keys = canonical.str[-config.MOBILE_SUFFIX_DIGITS:]
+    return keys, (canonical.str.len() >= config.MOBILE_SUFFIX_DIGITS).to_numpy()
+
+def build_block_index(keys, valid=None):
+    """Group row positions by key into CSR-style arrays
+
+    Block i holds positions[offsets[i]:offsets[i + 1]], in ascending row order.
+    Rows where valid is False are left out of every block.
+    """
+    index = {
+        'keys': {},
+        'codes': np.zeros(0, dtype=np.int32)
+    }
+    return extend_block_index(index, keys, valid)
+
+def extend_block_index(index, keys, valid=None):
+    """Append rows (positions continue after the indexed ones) and regroup the blocks"""
+    keys = pd.Series(keys, dtype=object).reset_index(drop=True)
+    codes = np.full(len(keys), -1, dtype=np.int32)
+    if valid is None:
+        valid = np.ones(len(keys), dtype=bool)
+    else:
+        valid = np.asarray(valid, dtype=bool)
+
+    # Known keys keep their code, unseen keys get the next free codes
+    new_codes, uniques = pd.factorize(keys[valid])
+    remap = pd.Index(list(index['keys']), dtype=object).get_indexer(uniques).astype(np.int32)
+    unseen = remap < 0
+    remap[unseen] = np.arange(len(index['keys']), len(index['keys']) + unseen.sum())
+    key_codes = dict(index['keys'])
+    key_codes.update(zip(uniques[unseen], remap[unseen].tolist()))
+    codes[valid] = remap[new_codes]
+
+    all_codes = np.concatenate([index['codes'], codes])
+    offsets, positions = _group_codes(all_codes, len(key_codes))
+    return {
+        'keys': key_codes,
+        'codes': all_codes,
+        'offsets': offsets,
+        'positions': positions
+    }
+
+def _group_codes(codes, n_keys):
+    """CSR offsets/positions for per-row block codes (-1 = not indexed)"""
+    # Stable sort keeps row order inside each block; excluded rows (-1) sort first
+    order = np.argsort(codes, kind='stable').astype(np.int32)
+    indexed = codes[codes >= 0]
+    positions = order[len(codes) - len(indexed):]
+    counts = np.bincount(indexed, minlength=n_keys)
+    offsets = np.zeros(n_keys + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets, positions
+
+def lookup_block(index, key):
+    """Row positions stored under key (empty array if the key is unknown)"""
+    code = index['keys'].get(key)
+    if code is None:
+        return index['positions'][:0]
+    return index['positions'][index['offsets'][code]:index['offsets'][code + 1]]
+
+def block_size(index, key):
+    """Number of rows in a block (0 if the key is not indexed)"""
+    code = index['keys'].get(key)
+    if code is None:
+        return 0
+    return int(index['offsets'][code + 1] - index['offsets'][code])
 
 def build_yearly_index(df_yearly, mobile_col):
-    """Build blocking index for faster search"""
-    yearly_blocks = {}
+    """Build blocking index for faster search (exact canonical mobile number)"""
     if mobile_col is None or mobile_col == 'None':
-        return yearly_blocks
-    
-    for idx, row in df_yearly.iterrows():
-        key = get_block_key(row[mobile_col])
-        if key not in yearly_blocks:
-            yearly_blocks[key] = []
-        yearly_blocks[key].append(row)
-    return yearly_blocks
+        return build_block_index([])
+    keys = canonical_mobile_series(df_yearly[mobile_col])
+    return build_block_index(keys, valid=(keys != "").to_numpy())
 
 def build_name_index(df_yearly, name_col):
     """Build name-based blocking index"""
-    name_blocks = {}
     if name_col is None or name_col == 'None':
-        return name_blocks
+        return build_block_index([])
+    keys = normalize_series(df_yearly[name_col])
+    return build_block_index(keys, valid=(keys != "").to_numpy())
+
+# Spelling variants common in transliterated Indian names, applied before Soundex
+_TRANSLITERATIONS = [
+    ('aa', 'a'), ('ee', 'i'), ('ii', 'i'), ('oo', 'u'), ('uu', 'u'), ('ou', 'u'),
+    ('ph', 'f'), ('bh', 'b'), ('kh', 'k'), ('gh', 'g'), ('dh', 'd'), ('th', 't'),
+    ('sh', 's'), ('ch', 'c'), ('jh', 'j'), ('ck', 'k'), ('w', 'v'), ('z', 'j'),
+    ('q', 'k'), ('x', 'ks')
+]
+_SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'), **dict.fromkeys('dt', '3'),
+    'l': '4', **dict.fromkeys('mn', '5'), 'r': '6', **dict.fromkeys('aeiou', '0')
+}
+
+def phonetic_token(token):
+    """Soundex code of one name token after folding transliteration variants
+
+    The first letter is coded too (vowels as 'a'), so 'Kavita'/'Cavita' and
+    'Iqbal'/'Eqbal' get the same key.
+    """
+    token = re.sub(r'[^a-z]', '', token.lower())
+    for variant, replacement in _TRANSLITERATIONS:
+        token = token.replace(variant, replacement)
+    token = token.rstrip('h')
+    if not token:
+        return ''
+    
+    first = _SOUNDEX_CODES.get(token[0], '')
+    key = 'a' if first == '0' else first or token[0]
+    last = first
+    for ch in token[1:]:
+        code = _SOUNDEX_CODES.get(ch, '')
+        if code == '' or code == last:
+            continue
+        last = code
+        if code != '0':
+            key += code
+    return key[:5]
+
+def phonetic_key(name):
+    """Phonetic blocking key of a full name (token codes, sorted)"""
+    codes = [phonetic_token(token) for token in str(name).split()]
+    return ' '.join(sorted(code for code in codes if code))
+
+def build_phonetic_index(names):
+    """Block index on phonetic_key of (normalized) names, computed once per distinct name"""
+    codes, uniques = pd.factorize(pd.Series(names, dtype=object))
+    unique_keys = np.asarray([phonetic_key(name) for name in uniques], dtype=object)
+    keys = unique_keys[codes] if len(codes) else unique_keys
+    return build_block_index(keys, valid=(keys != ''))
+
+def build_sorted_index(keys):
+    """Sorted-neighbourhood index: row positions ordered by key"""
+    keys = np.asarray(keys, dtype=object)
+    order = np.argsort(keys, kind='stable')
+    return {'keys': keys[order], 'positions': order.astype(np.int32)}
+
+def sorted_neighbourhood(sorted_index, key, window):
+    """Positions of the `window` rows on each side of where key sorts"""
+    at = int(np.searchsorted(sorted_index['keys'], key))
+    return sorted_index['positions'][max(0, at - window):at + window]
+
+# Fixed MinHash permutations so signatures are the same in every process and run
+_MINHASH_PRIME = 4294967311
+_MINHASH_RNG = np.random.default_rng(20240601)
+_MINHASH_A = _MINHASH_RNG.integers(1, 2 ** 31, size=64, dtype=np.uint64)
+_MINHASH_B = _MINHASH_RNG.integers(0, 2 ** 31, size=64, dtype=np.uint64)
+
+def qgram_hashes(text, q):
+    """CRC32 hashes of the distinct character q-grams of text"""
+    if len(text) <= q:
+        grams = {text} if text else set()
+    else:
+        grams = {text[i:i + q] for i in range(len(text) - q + 1)}
+    return [zlib.crc32(gram.encode('utf-8')) for gram in grams]
+
+def minhash_signatures(values, q=None, num_perm=None):
+    """MinHash signature matrix (len(values) x num_perm) of q-gram sets
+
+    Empty values get an all-max signature; check them with values != ''.
+    """
+    q = q or config.LSH_QGRAM
+    num_perm = num_perm or config.LSH_NUM_PERM
+    a = _MINHASH_A[:num_perm, None]
+    b = _MINHASH_B[:num_perm, None]
+    signatures = np.full((len(values), num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    
+    # Hash in slices so the (num_perm x grams) matrix stays small
+    for start in range(0, len(values), 20_000):
+        chunk = values[start:start + 20_000]
+        gram_lists = [qgram_hashes(value, q) for value in chunk]
+        lengths = np.array([len(grams) for grams in gram_lists])
+        filled = np.flatnonzero(lengths)
+        if len(filled) == 0:
+            continue
+        hashes = np.fromiter((h for grams in gram_lists for h in grams), dtype=np.uint64, count=int(lengths.sum()))
+        permuted = (a * hashes[None, :] + b) % np.uint64(_MINHASH_PRIME)
+        offsets = np.concatenate([[0], np.cumsum(lengths[filled])[:-1]])
+        signatures[start + filled] = np.minimum.reduceat(permuted, offsets, axis=1).T
+    return signatures
+
+def lsh_band_keys(signatures, bands=None):
+    """One integer key per band: the band's MinHash values packed together"""
+    bands = bands or config.LSH_BANDS
+    rows = signatures.shape[1] // bands
+    keys = []
+    for band in range(bands):
+        band_values = signatures[:, band * rows:(band + 1) * rows]
+        key = np.zeros(len(signatures), dtype=np.uint64)
+        for column in range(rows):
+            # FNV-style mixing keeps the key in 64 bits for any number of rows per band
+            key = (key ^ band_values[:, column]) * np.uint64(1099511628211)
+        keys.append(key)
+    return keys
+
+def build_lsh_index(values):
+    """MinHash-LSH index over q-grams: one block index per band"""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    uniques = list(uniques)
+    unique_bands = lsh_band_keys(minhash_signatures(uniques))
+    valid = np.asarray([value != '' for value in uniques], dtype=bool)[codes] if len(codes) else np.zeros(0, bool)
+    return [build_block_index(band_keys[codes].tolist() if len(codes) else [], valid=valid)
+            for band_keys in unique_bands]
+
+def lsh_candidates(lsh_index, value):
+    """Positions sharing at least one LSH band with value"""
+    if not value:
+        return []
+    band_keys = lsh_band_keys(minhash_signatures([value]))
+    return [lookup_block(block_index, int(keys[0])) for block_index, keys in zip(lsh_index, band_keys)]
+
+def build_multipass_index(yearly_cache, name_col, addr_col, extra_col, passes=None):
+    """Secondary blocking indexes for the configured passes (see config.BLOCKING_PASSES)"""
+    passes = config.BLOCKING_PASSES if passes is None else passes
+    index = {}
+    if name_col != 'None' and name_col is not None:
+        if 'phonetic_name' in passes:
+            index['phonetic_name'] = build_phonetic_index(yearly_cache[name_col]['norm'])
+        if 'sorted_name' in passes:
+            index['sorted_name'] = build_sorted_index(yearly_cache[name_col]['sorted'])
+    for pass_name, col in [('address_lsh', addr_col), ('extra_lsh', extra_col)]:
+        if col != 'None' and col is not None and pass_name in passes:
+            index[pass_name] = build_lsh_index(yearly_cache[col]['processed'])
+    return index
+
+def multipass_candidates(multipass_index, name_blocks, daily_cache, daily_pos, name_col, addr_col, extra_col,
+                         max_candidates=None):
+    """Union of candidate positions from all blocking passes for one daily row
+
+    The exact-name block is always kept in full; the other passes add new
+    candidates in pass order until max_candidates is reached. Positions are
+    returned in ascending order, like a regular block.
+    """
+    max_candidates = max_candidates or config.MAX_CANDIDATES_PER_ROW
     
-    for idx, row in df_yearly.iterrows():
-        key = normalize(row[name_col])
-        if key and key != "":
-            if key not in name_blocks:
-                name_blocks[key] = []
-            name_blocks[key].append(row)
-    return name_blocks
+    exact_block = []
+    pass_blocks = []
+    if name_col != 'None' and name_col is not None:
+        name = daily_cache[name_col]['norm'][daily_pos]
+        sorted_name = daily_cache[name_col]['sorted'][daily_pos]
+        exact_block = lookup_block(name_blocks, name).tolist()
+        if 'phonetic_name' in multipass_index and name:
+            pass_blocks.append(lookup_block(multipass_index['phonetic_name'], phonetic_key(name)))
+        if 'sorted_name' in multipass_index and sorted_name:
+            pass_blocks.append(sorted_neighbourhood(multipass_index['sorted_name'], sorted_name,
+                                                    config.SORTED_NEIGHBOURHOOD_WINDOW))
+    for pass_name, col in [('address_lsh', addr_col), ('extra_lsh', extra_col)]:
+        if pass_name in multipass_index:
+            pass_blocks.extend(lsh_candidates(multipass_index[pass_name], daily_cache[col]['processed'][daily_pos]))
+    
+    candidates = dict.fromkeys(exact_block)
+    limit = max(max_candidates, len(candidates))
+    for block in pass_blocks:
+        for pos in block.tolist():
+            if len(candidates) >= limit:
+                break
+            candidates.setdefault(pos)
+    return np.array(sorted(candidates), dtype=np.int32)
+
+def self_join_pairs(block_indexes, n_rows, max_block=None, window=None):
+    """Unordered candidate pairs (i < j) of rows that share a block in any of block_indexes
+
+    Blocks of up to max_block rows give all their pairs; in larger blocks each
+    row is only paired with the next `window` rows of the block, so the pair
+    count stays linear in the number of rows. A pair shared by several
+    blocks is returned once. Returns an (m, 2) int64 array sorted by i, then j.
+    """
+    max_block = max_block or config.SELF_JOIN_MAX_BLOCK
+    window = window or config.SELF_JOIN_WINDOW
+    codes = [np.zeros(0, dtype=np.int64)]
+    for index in block_indexes:
+        offsets = index['offsets']
+        for code in np.flatnonzero(np.diff(offsets) >= 2):
+            block = np.sort(np.asarray(index['positions'][offsets[code]:offsets[code + 1]], dtype=np.int64))
+            if len(block) <= max_block:
+                first, second = np.triu_indices(len(block), k=1)
+            else:
+                first = np.concatenate([np.arange(len(block) - step) for step in range(1, window + 1)])
+                second = np.concatenate([np.arange(step, len(block)) for step in range(1, window + 1)])
+            codes.append(block[first] * n_rows + block[second])
+    unique = np.unique(np.concatenate(codes))
+    return np.column_stack((unique // max(n_rows, 1), unique % max(n_rows, 1)))
+
+def self_join_indexes(index, cache, name_col, passes=None):
+    """Block indexes for a self-join (see config.SELF_JOIN_BLOCKS)
+
+    index is a yearly-style index (index_store._index_rows); the phonetic
+    name blocks are built from the column cache.
+    """
+    passes = config.SELF_JOIN_BLOCKS if passes is None else passes
+    indexes = [index[name] for name in ['mobile', 'mobile_suffix', 'name'] if name in passes]
+    if 'phonetic_name' in passes and name_col != 'None' and name_col is not None:
+        indexes.append(build_phonetic_index(cache[name_col]['norm']))
+    return indexes
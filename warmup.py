@@ -0,0 +1,62 @@
+"""Warm start: get a new app process ready for its first comparison in the background
+
+warm_start() returns at once; a daemon thread then imports the heavy modules
+(pandas, NumPy, rapidfuzz, gspread), preloads the most recently used yearly
+index from the local index store together with its column cache
+(index_store.preload_yearly_index), and runs the rapidfuzz scorers once on
+a sample of its values. A first comparison against that yearly sheet then
+finds everything in memory. Progress is kept in warm_status().
+"""
+import importlib
+import threading
+import time
+import config
+
+_status = {'state': 'idle', 'seconds': None, 'index_rows': None, 'error': None}
+_lock = threading.Lock()
+_thread = None
+
+def warm_status():
+    """Copy of the warm start state: 'idle', 'running', 'done' or 'failed', with timings"""
+    return dict(_status)
+
+def warm_start(cache_dir=None):
+    """Start warming up in a background thread (once per process); returns the thread"""
+    global _thread
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_warm, args=(cache_dir,), name='warm-start', daemon=True)
+            _status['state'] = 'running'
+            _thread.start()
+        return _thread
+
+def warm_scorers(values):
+    """Run the scorers the matcher uses (pairwise and batched) once on a few values"""
+    from rapidfuzz import fuzz, process
+    values = [str(value) for value in values][:config.WARM_START_SAMPLE_ROWS] or ['warm up']
+    for scorer in [fuzz.ratio, fuzz.token_set_ratio]:
+        scorer(values[0], values[-1])
+        process.cdist(values, values, scorer=scorer, workers=1)
+
+def _warm(cache_dir):
+    started = time.perf_counter()
+    try:
+        importlib.import_module('pipeline')  # pandas, NumPy, rapidfuzz and the matcher
+        importlib.import_module('google_sheets')  # gspread, oauth2client
+        from index_store import last_used_index, preload_yearly_index
+
+        values = []
+        last_used = last_used_index(cache_dir)
+        index = preload_yearly_index(last_used['path'], last_used['columns']) if last_used else None
+        if index is not None:
+            _status['index_rows'] = index['rows']
+            normalized = index['normalized']
+            if len(normalized.columns):
+                values = normalized.iloc[:config.WARM_START_SAMPLE_ROWS, 0].tolist()
+        warm_scorers(values)
+        _status['state'] = 'done'
+    except Exception as e:
+        # Warming is best effort: the first comparison just loads everything itself
+        _status['state'] = 'failed'
+        _status['error'] = str(e)
+    _status['seconds'] = round(time.perf_counter() - started, 3)
@@ -0,0 +1,197 @@
+"""Watch mode: poll the daily sheet and only match rows added or edited since the last poll
+
+The first poll works like a normal run (both result tabs rewritten). After
+that, only daily rows whose content was not seen before are scored against
+the yearly sheet, which is loaded and indexed once. Their results are
+appended to the result tabs, and only the newly found perfect duplicates
+are deleted. Rows are recognised by a hash of their content, so the
+deletions (which shift row numbers) do not make old rows look new.
+
+Rows count as processed once they are scored. Results that could not be
+appended (per tab) and perfect duplicates that could not be deleted are
+kept in the watch state and retried on the next poll, so nothing is
+appended twice and a failed poll is retried even if the sheet is unchanged.
+"""
+import time
+import numpy as np
+import pandas as pd
+from gspread.exceptions import APIError
+from google.auth.exceptions import TransportError
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+from utils import build_column_cache, build_multipass_index, run_concurrently
+from index_store import load_or_build_yearly_index
+from pipeline import load_frame, find_duplicates, build_results, update_sheets
+from google_sheets import (
+    authenticate_google_sheets,
+    get_sheet_by_url,
+    get_modified_time,
+    append_df_to_sheet,
+    delete_rows_by_indices,
+    SheetFrameCache
+)
+from instrumentation import stage
+import config
+
+# Poll failures that go away on their own (quota, server and network errors)
+TRANSIENT_ERRORS = (APIError, RequestsConnectionError, Timeout, TransportError)
+RESULT_TABS = ["Possible Duplicates", "Perfect Duplicates"]
+
+def new_watch_state():
+    """Watch state: processed rows (count and content), work left over from a failed poll, and
+    the modified time of the daily sheet as of the last poll that finished
+    """
+    return {
+        'watermark': 0,
+        'row_counts': pd.Series(dtype=np.int64),
+        'unwritten': {},
+        'pending_positions': np.zeros(0, dtype=np.int64),
+        'pending_hashes': np.zeros(0, dtype=np.uint64),
+        'processed_time': None,
+        'cycles': 0
+    }
+
+def row_hashes(df):
+    """64-bit hash of each row's text (same text, same hash, whatever the column dtypes)"""
+    return pd.util.hash_pandas_object(df.astype(str), index=False).reset_index(drop=True)
+
+def changed_rows(hashes, row_counts):
+    """Mask of rows not covered by row_counts
+
+    A row content seen k times before covers its first k occurrences, so a
+    re-entry of an already processed row still counts as new.
+    """
+    occurrence = hashes.groupby(hashes).cumcount().to_numpy()
+    known = hashes.map(row_counts).fillna(0).to_numpy()
+    return occurrence >= known
+
+def prepare_yearly(df_yearly, yearly_index, name_col, mobile_col, addr_col, extra_col):
+    """Column cache and multi-pass index of the yearly sheet, built once for all polls"""
+    cache = build_column_cache(df_yearly, name_col, mobile_col, addr_col, extra_col,
+                               normalized=yearly_index['normalized'])
+    return {
+        'index': yearly_index,
+        'cache': cache,
+        'multipass': build_multipass_index(cache, name_col, addr_col, extra_col)
+    }
+
+def append_results(daily_spreadsheet, unwritten, report=None):
+    """Append unwritten ({tab: DataFrame}) to the result tabs, removing each tab once it is appended"""
+    def append_tab(sheet_name):
+        with stage(report, f"append '{sheet_name}'"):
+            append_df_to_sheet(daily_spreadsheet, sheet_name, unwritten[sheet_name])
+        del unwritten[sheet_name]
+
+    run_concurrently([lambda name=name: append_tab(name) for name in list(unwritten)])
+
+def pending_deletions(state, hashes):
+    """Positions of the pending perfect duplicates that still hold the row they were found in"""
+    positions = state['pending_positions']
+    in_sheet = positions < len(hashes)
+    positions, expected = positions[in_sheet], state['pending_hashes'][in_sheet]
+    return positions[hashes.to_numpy()[positions] == expected]
+
+def watch_cycle(state, daily_spreadsheet, df_yearly, yearly, columns, cache, notify=None, report=None):
+    """One poll of the daily sheet; returns a summary dict, or None if nothing changed since the last poll
+
+    Rows should only be appended to the daily sheet while watching: the
+    perfect duplicates are deleted by the positions read in this poll.
+    """
+    notify = notify or (lambda message, done=False: print(message))
+    worksheet = daily_spreadsheet.sheet1
+    modified_time = get_modified_time(daily_spreadsheet)
+    df_daily, _ = cache.get(worksheet, modified_time)
+    leftover = state['unwritten'] or len(state['pending_positions'])
+    if modified_time == state['processed_time'] and not leftover:
+        return None
+
+    hashes = row_hashes(df_daily)
+    pending = pending_deletions(state, hashes)
+    positions = np.flatnonzero(changed_rows(hashes, state['row_counts']))
+    new_rows = int((positions >= state['watermark']).sum())
+    summary = {
+        'daily_rows': len(df_daily),
+        'new_rows': new_rows,
+        'edited_rows': len(positions) - new_rows,
+        'matches': 0,
+        'perfect_deleted': 0
+    }
+
+    perfect_positions = np.zeros(0, dtype=np.int64)
+    if len(positions):
+        df_new = df_daily.iloc[positions].reset_index(drop=True)
+        matches = find_duplicates(df_new, df_yearly, yearly['index'], *columns, report=report,
+                                  yearly_cache=yearly['cache'], multipass_index=yearly['multipass'])
+        df_all_duplicates, df_perfect_only, perfect_ids = build_results(df_new, df_yearly, matches, *columns,
+                                                                       record_numbers=positions + 1)
+        perfect_positions = positions[sorted(perfect_ids)]
+        if state['cycles'] == 0:
+            update_sheets(daily_spreadsheet, worksheet, df_all_duplicates, df_perfect_only,
+                          perfect_positions.tolist(), notify=notify, report=report)
+        else:
+            unwritten = state['unwritten']
+            for name, df in zip(RESULT_TABS, [df_all_duplicates, df_perfect_only]):
+                if not df.empty:
+                    unwritten[name] = pd.concat([unwritten[name], df], ignore_index=True) if name in unwritten else df
+        summary['matches'] = len(df_all_duplicates)
+
+    if state['cycles']:
+        # The rows count as processed from here on: if an append or the delete
+        # fails, the next poll retries just that instead of scoring them again
+        perfect_positions = np.union1d(pending, perfect_positions)
+        state['row_counts'] = hashes.value_counts()
+        state['watermark'] = len(df_daily)
+        state['pending_positions'] = perfect_positions
+        state['pending_hashes'] = hashes.to_numpy()[perfect_positions]
+        append_results(daily_spreadsheet, state['unwritten'], report=report)
+        # Perfect duplicates are only deleted once their results are written
+        if len(perfect_positions):
+            with stage(report, 'delete perfect duplicates'):
+                delete_rows_by_indices(worksheet, perfect_positions.tolist())
+    summary['perfect_deleted'] = len(perfect_positions)
+
+    # Deleted rows are gone from the sheet, everything else has been processed
+    keep = np.ones(len(df_daily), dtype=bool)
+    keep[perfect_positions] = False
+    state['row_counts'] = hashes[keep].value_counts()
+    state['watermark'] = int(keep.sum())
+    state['pending_positions'] = np.zeros(0, dtype=np.int64)
+    state['pending_hashes'] = np.zeros(0, dtype=np.uint64)
+    state['processed_time'] = modified_time
+    state['cycles'] += 1
+    return summary
+
+def watch(yearly_source, daily_url, name_col='None', mobile_col='None', addr_col='None', extra_col='None',
+          credentials=None, interval=None, max_polls=None):
+    """Poll daily_url every interval seconds (max_polls times, default forever)
+
+    A poll that fails with an API or network error is reported and its
+    leftover appends and deletes are retried on the next poll.
+    """
+    interval = config.WATCH_INTERVAL_SECONDS if interval is None else interval
+    columns = (name_col, mobile_col, addr_col, extra_col)
+    client = authenticate_google_sheets(credentials)
+
+    df_yearly, yearly_id = load_frame(yearly_source, client)
+    yearly_index, rows_added = load_or_build_yearly_index(df_yearly, yearly_id, *columns)
+    yearly = prepare_yearly(df_yearly, yearly_index, *columns)
+    print(f"Loaded {len(df_yearly)} yearly rows ({rows_added} new rows indexed)")
+
+    daily_spreadsheet = get_sheet_by_url(client, daily_url)
+    state = new_watch_state()
+    cache = SheetFrameCache(max_entries=1)
+    polls = 0
+    while True:
+        try:
+            summary = watch_cycle(state, daily_spreadsheet, df_yearly, yearly, columns, cache)
+        except TRANSIENT_ERRORS as e:
+            print(f"Poll failed, retrying next time: {e}")
+        else:
+            if summary is None:
+                print("Daily sheet unchanged")
+            else:
+                print(f"{summary['daily_rows']} daily rows: {summary['new_rows']} new, {summary['edited_rows']} edited, "
+                      f"{summary['matches']} matches, {summary['perfect_deleted']} perfect duplicates deleted")
+        polls += 1
+        if max_polls is not None and polls >= max_polls:
+            return state
+        time.sleep(interval)